@@ -0,0 +1,459 @@
+'''
+
+    Benchmarks for the distance vector server (dv.py)
+        Description:
+        Small standalone timing scripts - each one builds a server state in memory and
+        times the hot paths of dv.py on synthetic routing tables
+            - wire: encode/decode cost of the json and binary packet formats
+            - engine: bell_ford() on the dict routing table vs the array engine
+            - rx: packets per second through rx() on a loopback socket
+            - mem: bytes per route of the routing table engines at 100k destinations
+            - zip: compression ratio and cpu per packet of --compress for each format/level
+            - gen: writes a generated topology (ring, grid, random, scale-free) in the
+              read_top() file format
+            - suite: all of the above plus convergence after a link change / crash (sim.py)
+              on generated topologies, written to a json file to compare versions. The
+              simulator runs every server in one process - keep --conv-nodes to a few
+              thousand
+
+        Usage Example:
+            python3 bench.py wire
+            python3 bench.py wire -n 10 100 1000 10000
+            python3 bench.py engine -n 1000 10000
+            python3 bench.py rx -n 100 1000
+            python3 bench.py mem -n 100000
+            python3 bench.py zip -n 100 1000 10000 -l 1 6 9
+            python3 bench.py gen -k scalefree -n 1000 -o sf1000.txt
+            python3 bench.py suite -o bench_results.json
+
+'''
+import argparse
+import itertools
+import json
+import math
+import platform
+import random
+import socket
+import subprocess
+import threading
+import time
+import timeit
+import tracemalloc
+import zlib
+
+import dv
+import oracle
+import sim
+
+# generated topologies
+KINDS = ('ring', 'grid', 'random', 'scalefree')
+
+'''
+
+    Command: def mk_state(): builds a server state with n destinations, bound to an ephemeral
+                             port on localhost. Server 1 is the user, server 2 its only neighbor.
+
+'''
+def mk_state(n, interval=1, **kw):
+    servers = {i: ('127.0.0.1', 0) for i in range(1, n + 1)}
+    rc = [['1', '2', '1']] if n > 1 else []
+    st = dv.state(servers, rc, interval, 1, **kw)
+    # fill in reachable costs for every destination - through set_route() so the next hop
+    # index matches the table
+    with st['lock']:
+        for d in range(2, n + 1):
+            dv.set_route(st, d, 2, d)
+    return st
+
+'''
+
+    Command: def per_op(): runs fn repeatedly and returns the best time for one call (seconds)
+
+'''
+def per_op(fn, number=None):
+    timer = timeit.Timer(fn)
+    if number is None:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+'''
+
+    Command: def b_wire(): times data_pckt() + decode_pckt() for both wire formats
+
+'''
+def b_wire(sizes):
+    res = []
+    print(f"{'nodes':>8} | {'fmt':>4} | {'bytes':>9} | {'encode us':>10} | {'decode us':>10}")
+    for n in sizes:
+        st = mk_state(n)
+        for fmt in ('json', 'bin'):
+            data = dv.data_pckt(st, fmt=fmt)
+            enc = per_op(lambda: dv.data_pckt(st, fmt=fmt))
+            dec = per_op(lambda: dv.decode_pckt(data))
+            print(f"{n:>8} | {fmt:>4} | {len(data):>9} | {enc * 1e6:>10.1f} | {dec * 1e6:>10.1f}")
+            res.append({'nodes': n, 'fmt': fmt, 'bytes': len(data), 'encode_us': enc * 1e6,
+                        'decode_us': dec * 1e6})
+        st['sock'].close()
+    return res
+
+'''
+
+    Command: def b_engine(): times one bell_ford() call with a full vector from the neighbor,
+                             for the dict table and the array engine, json and binary input.
+                             steady - the vector changes nothing, churn - every route changes
+
+'''
+def b_engine(sizes):
+    res = []
+    engines = ['dict', 'array']
+    print(f"{'nodes':>8} | {'engine':>6} | {'input':>5} | {'steady us':>10} | {'churn us':>10}")
+    for n in sizes:
+        # neighbor 2 advertises d (or d + 1) for every destination
+        vecs = [{d: d + k for d in range(1, n + 1)} for k in (0, 1)]
+        inputs = {
+            'json': [json.loads(json.dumps(v)) for v in vecs],
+            'bin': [dv.decode_pckt(dv.enc_bin(2, '127.0.0.1', 0, v))[0]['rt'] for v in vecs]
+        }
+        for engine in engines:
+            st = mk_state(n, engine=engine)
+            for name, (a, b) in inputs.items():
+                dv.bell_ford(st, 2, a, full=True)
+                steady = per_op(lambda: dv.bell_ford(st, 2, a, full=True))
+                flip = itertools.cycle((b, a))
+                churn = per_op(lambda: dv.bell_ford(st, 2, next(flip), full=True), number=20)
+                print(f"{n:>8} | {engine:>6} | {name:>5} | {steady * 1e6:>10.1f} | {churn * 1e6:>10.1f}")
+                res.append({'nodes': n, 'engine': engine, 'input': name,
+                            'steady_us': steady * 1e6, 'churn_us': churn * 1e6})
+            st['sock'].close()
+    return res
+
+'''
+
+    Command: def b_mem(): memory per route at n destinations (tracemalloc) - the routing table
+                          alone, and the whole server after a full vector from its neighbor
+                          (table, next hop index, cached vector, route ages). Also times a
+                          field read through NodeState attributes, its mapping access and a
+                          plain dict.
+
+'''
+def b_mem(sizes):
+    res = []
+    print(f"{'nodes':>8} | {'engine':>6} | {'rt B/route':>10} | {'node B/route':>12}")
+    for n in sizes:
+        servers = {i: ('127.0.0.1', 0) for i in range(1, n + 1)}
+        vec = {d: d for d in range(1, n + 1)}
+        for engine in ('dict', 'array'):
+            tracemalloc.start()
+            # table alone
+            before = tracemalloc.get_traced_memory()[0]
+            rt = dv.ArrayRT() if engine == 'array' else {}
+            for d in range(1, n + 1):
+                rt[d] = (2, d)
+            rt_bytes = tracemalloc.get_traced_memory()[0] - before
+            del rt
+            # whole server
+            before = tracemalloc.get_traced_memory()[0]
+            st = dv.state(servers, [['1', '2', '1']], 1, 1, engine=engine)
+            dv.bell_ford(st, 2, vec, full=True)
+            node_bytes = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+            st['sock'].close()
+            print(f"{n:>8} | {engine:>6} | {rt_bytes / n:>10.1f} | {node_bytes / n:>12.1f}")
+            res.append({'nodes': n, 'engine': engine, 'rt_bytes_per_route': rt_bytes / n,
+                        'node_bytes_per_route': node_bytes / n})
+    # field reads - the hot paths use attributes
+    st = mk_state(2)
+    plain = {'rt': st.rt}
+    reads = {
+        'attribute': per_op(lambda: st.rt),
+        'mapping': per_op(lambda: st['rt']),
+        'dict': per_op(lambda: plain['rt'])
+    }
+    st['sock'].close()
+    print("\nfield read: " + ", ".join(f"{k} {v * 1e9:.1f} ns" for k, v in reads.items()))
+    res.append({'field_read_ns': {k: v * 1e9 for k, v in reads.items()}})
+    return res
+
+'''
+
+    Command: def b_zip(): compression ratio and cpu per packet (zip_pckt/unzip_pckt) of a full
+                          table, a quarter of the destinations unreachable (INF)
+
+'''
+def b_zip(sizes, levels):
+    res = []
+    print(f"{'nodes':>8} | {'fmt':>4} | {'level':>5} | {'bytes':>9} | {'zipped':>9} | {'ratio':>6} "
+          f"| {'zip us':>9} | {'unzip us':>9}")
+    for n in sizes:
+        st = mk_state(n)
+        for d in range(4, n + 1, 4):
+            st['rt'][d] = (-1, dv.INF)
+        for fmt in ('json', 'bin'):
+            data = dv.data_pckt(st, fmt=fmt)
+            for level in levels:
+                st['zlevel'], st['zmin'] = level, 0
+                out = dv.zip_pckt(st, data)
+                zipped = per_op(lambda: zlib.compress(data, level))
+                unzipped = per_op(lambda: dv.unzip_pckt(st, out))
+                ratio = len(data) / len(out)
+                print(f"{n:>8} | {fmt:>4} | {level:>5} | {len(data):>9} | {len(out):>9} "
+                      f"| {ratio:>6.2f} | {zipped * 1e6:>9.1f} | {unzipped * 1e6:>9.1f}")
+                res.append({'nodes': n, 'fmt': fmt, 'level': level, 'bytes': len(data),
+                            'zipped': len(out), 'ratio': ratio, 'zip_us': zipped * 1e6,
+                            'unzip_us': unzipped * 1e6})
+        st['sock'].close()
+    return res
+
+'''
+
+    Command: def b_rx(): packets per second through a running rx() thread. A plain UDP socket
+                         sends full vectors of n destinations from neighbor 2, keeping at most
+                         'window' packets in flight so the receive buffer does not overflow.
+
+'''
+def b_rx(sizes, count=2000, window=32):
+    res = []
+    print(f"{'nodes':>8} | {'fmt':>4} | {'pkts':>6} | {'pkts/s':>10} | {'MB/s':>8}")
+    for n in sizes:
+        for fmt in ('json', 'bin'):
+            # the sending socket is not at server 2's address
+            st = mk_state(n, src_check=False)
+            addr = st['sock'].getsockname()
+            vec = {d: d for d in range(1, n + 1)}
+            if fmt == 'bin':
+                pckt = dv.enc_bin(2, '127.0.0.1', 0, vec)
+            else:
+                pckt = json.dumps({'user': 2, 'my_ip': '127.0.0.1', 'my_port': 0, 'rt': vec}).encode()
+            dgrams = dv.frag_pckt(st, pckt)
+            thread = threading.Thread(target=dv.rx, args=(st,), daemon=True)
+            thread.start()
+            snd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            start = time.perf_counter()
+            for k in range(count):
+                # wait for the receiver to catch up
+                while k - st.pkts > window and time.perf_counter() - start < 60:
+                    time.sleep(0)
+                for dgram in dgrams:
+                    snd.sendto(dgram, addr)
+            # drain - stop when nothing arrives for a second
+            seen, last = -1, time.perf_counter()
+            while st.pkts < count and time.perf_counter() - last < 1.0:
+                if st.pkts != seen:
+                    seen, last = st.pkts, time.perf_counter()
+                time.sleep(0.001)
+            took = time.perf_counter() - start
+            got = st['pkts']
+            st['stop'].set()
+            thread.join()
+            snd.close()
+            st['sock'].close()
+            pps = got / took
+            print(f"{n:>8} | {fmt:>4} | {got:>6} | {pps:>10.0f} | {pps * len(pckt) / 1e6:>8.2f}")
+            res.append({'nodes': n, 'fmt': fmt, 'sent': count, 'received': got,
+                        'pkts_per_s': pps, 'bytes': len(pckt)})
+    return res
+
+'''
+
+    Command: def gen_top(): generates a connected topology with link costs 1..max_cost
+
+    Returns:
+        servers: dictionary of server_ID : (ip,port)
+        rc: list of links [server1, server2, cost] as strings, like read_top()
+
+'''
+def gen_top(kind, n, seed=1, max_cost=5):
+    rnd = random.Random(seed)
+    edges = set()
+    if kind == 'ring':
+        edges = {(i, i % n + 1) for i in range(1, n + 1)}
+    elif kind == 'grid':
+        w = math.ceil(math.sqrt(n))
+        for i in range(n):
+            if (i + 1) % w and i + 1 < n:
+                edges.add((i + 1, i + 2))
+            if i + w < n:
+                edges.add((i + 1, i + w + 1))
+    elif kind == 'random':
+        # ring keeps it connected, random chords up to an average degree of 4
+        edges = {(i, i % n + 1) for i in range(1, n + 1)}
+        while len(edges) < 2 * n and n > 4:
+            a, b = rnd.sample(range(1, n + 1), 2)
+            edges.add((a, b))
+    elif kind == 'scalefree':
+        # Barabasi-Albert, 2 links per new server
+        ends = []
+        for i in range(2, n + 1):
+            picks = {1} if i == 2 else set()
+            while len(picks) < min(2, i - 1):
+                picks.add(rnd.choice(ends))
+            for j in picks:
+                edges.add((j, i))
+                ends += [i, j]
+    else:
+        raise ValueError(f"unknown topology kind {kind}")
+    # one link per server pair, no loops
+    edges = {(min(a, b), max(a, b)) for a, b in edges if a != b}
+    servers = {i: (f"127.{i // 50000}.0.1", 10000 + i % 50000) for i in range(1, n + 1)}
+    rc = [[str(a), str(b), str(rnd.randint(1, max_cost))] for a, b in sorted(edges)]
+    return servers, rc
+
+# helper function - write a topology in the read_top() file format
+def write_top(path, servers, rc):
+    with open(path, 'w') as f:
+        f.write(f"{len(servers)}\n{len(rc)}\n")
+        for srv_id, (ip, port) in servers.items():
+            f.write(f"{srv_id} {ip} {port}\n")
+        for row in rc:
+            f.write(" ".join(row) + "\n")
+
+'''
+
+    Command: def b_conv(): convergence on generated topologies with the simulator - start, link
+                           cost change (first link x10) and crash of server 1. infinity 0 picks
+                           one above a bound on the longest shortest path of every phase
+                           (span()), so counting to infinity after the crash stays short.
+                           A phase that does not settle within max_time is reported as failed
+                           (time None). sim.py runs every server in one process - a few
+                           thousand servers per topology is the practical limit.
+
+'''
+def b_conv(kinds, sizes, max_time=60, infinity=0, max_cost=5, **opts):
+    res = []
+    for kind in kinds:
+        for n in sizes:
+            servers, rc = gen_top(kind, n, max_cost=max_cost)
+            print(f"\n{kind} {n}: ", end='')
+            s1, s2, cost = rc[0]
+            update = (s1, s2, str(int(cost) * 10))
+            if not infinity:
+                # the topology after each phase - start, update, crash of server 1
+                upd = [(a, b, update[2]) if (a, b) == (s1, s2) else (a, b, c) for a, b, c in rc]
+                crashed = {srv_id: v for srv_id, v in servers.items() if srv_id != 1}
+                left = [r for r in upd if '1' not in (r[0], r[1])]
+                inf = max(span(servers, rc), span(servers, upd), span(crashed, left)) + 1
+            else:
+                inf = infinity
+            _, phases = sim.simulate(servers, rc, 1, update=update, crash=1,
+                                     max_time=max_time, infinity=inf, **opts)
+            for ph in phases:
+                row = dict(ph, kind=kind, nodes=n, links=len(rc), infinity=inf,
+                           failed=not ph['converged'])
+                # not settled - no convergence time to report
+                if row['failed']:
+                    row['time'] = row['msgs'] = row['bytes'] = None
+                    print(f"FAILED: {kind} {n} {ph['phase']} did not converge in {max_time} s")
+                res.append(row)
+    return res
+
+# helper function - upper bound on the longest shortest path (oracle): within a connected
+# part, no path is longer than twice the farthest server from any one server
+def span(servers, rc):
+    adj = oracle.graph(servers, rc)
+    seen, bound = set(), 0
+    for src in servers:
+        if src in seen:
+            continue
+        dist = oracle.dijkstra(adj, src)
+        seen.update(dist)
+        bound = max(bound, 2 * max(cost for hop, cost in dist.values()))
+    return bound
+
+'''
+
+    Command: def b_suite(): runs every benchmark and writes one json file - machine, version
+                            and the results of each benchmark
+
+'''
+def b_suite(out, sizes, conv_sizes, kinds, max_time, **opts):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    res = {
+        'commit' : commit,
+        'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python' : platform.python_version(),
+        'numpy' : dv.np is not None,
+        'options' : opts
+    }
+    res['wire'] = b_wire(sizes)
+    res['engine'] = b_engine(sizes)
+    res['rx'] = b_rx(sizes)
+    res['mem'] = b_mem([max(sizes)])
+    res['zip'] = b_zip(sizes, [1, 6])
+    res['convergence'] = b_conv(kinds, conv_sizes, max_time=max_time, **opts)
+    res['conv_failed'] = sum(ph['failed'] for ph in res['convergence'])
+    with open(out, 'w') as f:
+        json.dump(res, f, indent=1)
+    if res['conv_failed']:
+        print(f"\n{res['conv_failed']} convergence phase(s) FAILED")
+    print(f"\nresults written to {out}")
+    return res
+
+'''
+
+    Command: def p_args(): handles the command line for the benchmarks
+
+'''
+def p_args():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest='bench', required=True)
+    # wire format encode/decode
+    w = sub.add_parser('wire')
+    w.add_argument('-n','--nodes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    # routing table engines
+    e = sub.add_parser('engine')
+    e.add_argument('-n','--nodes', type=int, nargs='+', default=[1000, 10000])
+    # rx() throughput
+    r = sub.add_parser('rx')
+    r.add_argument('-n','--nodes', type=int, nargs='+', default=[10, 100, 1000])
+    r.add_argument('-c','--count', type=int, default=2000)
+    # memory per route
+    m = sub.add_parser('mem')
+    m.add_argument('-n','--nodes', type=int, nargs='+', default=[100000])
+    # compression
+    z = sub.add_parser('zip')
+    z.add_argument('-n','--nodes', type=int, nargs='+', default=[100, 1000, 10000])
+    z.add_argument('-l','--levels', type=int, nargs='+', default=[1, 6, 9])
+    # topology generator
+    g = sub.add_parser('gen')
+    g.add_argument('-k','--kind', choices=KINDS, required=True)
+    g.add_argument('-n','--nodes', type=int, required=True)
+    g.add_argument('-s','--seed', type=int, default=1)
+    g.add_argument('-o','--out', required=True)
+    # everything, to a json file
+    s = sub.add_parser('suite')
+    s.add_argument('-o','--out', default='bench_results.json')
+    s.add_argument('-n','--nodes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    s.add_argument('--conv-nodes', type=int, nargs='+', default=[10, 100, 300])
+    s.add_argument('-k','--kinds', choices=KINDS, nargs='+', default=list(KINDS))
+    s.add_argument('--max-time', type=float, default=60)
+    s.add_argument('-e','--engine', choices=('dict','array'), default='dict')
+    s.add_argument('-d','--delta', action='store_true')
+    s.add_argument('--horizon', choices=('none','split','poison'), default='poison')
+    s.add_argument('--infinity', type=int, default=0)
+    return ap.parse_args()
+
+def main():
+    args = p_args()
+    if args.bench == 'wire':
+        b_wire(args.nodes)
+    elif args.bench == 'engine':
+        b_engine(args.nodes)
+    elif args.bench == 'rx':
+        b_rx(args.nodes, count=args.count)
+    elif args.bench == 'mem':
+        b_mem(args.nodes)
+    elif args.bench == 'zip':
+        b_zip(args.nodes, args.levels)
+    elif args.bench == 'gen':
+        write_top(args.out, *gen_top(args.kind, args.nodes, seed=args.seed))
+    elif args.bench == 'suite':
+        b_suite(args.out, args.nodes, args.conv_nodes, args.kinds, args.max_time,
+                engine=args.engine, delta=args.delta, horizon=args.horizon,
+                infinity=args.infinity)
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,346 @@
 '''
 import socket # for socket programming
 import argparse
+import asyncio
+import contextlib
+import heapq
+import io
 import json
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
 import threading
 import time
+import zlib
+from array import array
+from collections import namedtuple
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+# optional - vectorized routing table engine
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # constant - infinite cost
 INF = 1000000000
-num_servers = 0
-num_neighbors = 0
-servers = {} # server_ID :(ip,port)  
-rc = []
 interval = 0
+# binary wire format - magic, version, flags, reason, user, ip, port, count
+WIRE_MAGIC = b'DV'
+WIRE_VER = 1
+HDR = struct.Struct('!2sBBBI4sHI')
+# optional link update (server1, server2, cost)
+LINK = struct.Struct('!III')
+# header flag bits
+F_LINK = 0x01
+F_SEQ = 0x02
+F_FULL = 0x04
+F_RESYNC = 0x08
+F_LINKS = 0x10
+F_SPLIT = 0x20
+# list of link updates (bulk update) - count, then LINK records
+LINK_N = struct.Struct('!H')
+# optional sequence number (incremental updates)
+SEQ = struct.Struct('!I')
+# reason <-> code (index in tuple)
+REASONS = (None, 'step', 'update')
+# largest UDP payload and receive buffer size
+MAX_UDP = 65507
+RECV_BUF = 65535
+# fragment header - magic, message id, fragment index, fragment count
+FRAG_MAGIC = b'DF'
+FRAG = struct.Struct('!2sIHH')
+# compressed packet (--compress) - magic, then the zlib stream of the whole packet, which
+# decompresses to at most ZIP_MAX bytes
+ZIP_MAGIC = b'DZ'
+ZIP_MAX = 1 << 28
+# largest server id kept in the array engine's id -> index lookup vector
+LUT_MAX = 1 << 22
+# topology files this large are memory-mapped by load_top()
+MMAP_MIN = 64 * 1024 * 1024
+# capture file (--capture) - magic, then per record kind, clock, sender ip, port, length
+CAP_MAGIC = b'DVCAP\x01'
+CAP_REC = struct.Struct('!Bd4sHI')
+CAP_PKT = 0
+CAP_CMD = 1
+CAP_RT = 2
+# checkpoint file (--checkpoint) for a warm start
+CK_MAGIC = b'DVCK\x01'
+# wrong routes listed by the verify command
+VERIFY_SHOW = 20
+# profile command - samples a second, hot functions listed
+PROFILE_HZ = 200
+PROFILE_HZ_MAX = 1000
+PROFILE_TOP = 15
+# route flap damping - penalty per change, and above which triggered updates are held back
+DAMP_STEP = 1000
+DAMP_SUPPRESS = 2000
+# neighbors per sender pool job (--send-threads)
+SEND_BATCH = 64
+# bulk - prompt for updates from stdin
+BULK_PROMPT = "Enter <server1> <server2> <cost> per line, empty line to finish."
+
+'''
+
+    Class: TimedLock
+        threading.Lock that adds up how long callers waited for it and how long they held
+        it (state['lock'] - shown by the stats command). on_release runs before every
+        release (state() publishes the routing table snapshot there).
+
+'''
+class TimedLock:
+    __slots__ = ('lock', 'acquires', 'wait', 'wait_max', 'hold', 'hold_max', 'since',
+                 'on_release')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.on_release = None
+        self.acquires = 0
+        self.wait = self.wait_max = self.hold = self.hold_max = self.since = 0.0
+
+    def __enter__(self):
+        t = time.perf_counter()
+        self.lock.acquire()
+        self.since = now = time.perf_counter()
+        self.acquires += 1
+        self.wait += now - t
+        if now - t > self.wait_max:
+            self.wait_max = now - t
+        return self
+
+    def __exit__(self, *exc):
+        if self.on_release is not None:
+            self.on_release()
+        held = time.perf_counter() - self.since
+        self.hold += held
+        if held > self.hold_max:
+            self.hold_max = held
+        self.lock.release()
+
+'''
+
+    Class: NodeState
+        Server state returned by state() - one slot per field instead of a dict entry. The hot
+        paths (set_route, bell_ford, update_neighbor_status, data_pckt, dead_neigh) read the
+        attributes directly, everything else can still index it like the old dictionary
+        (state['rt'], state.get('timer'), 'rt' in state). A field that was never set is
+        missing, like a key that is not in the dictionary.
+
+'''
+class NodeState:
+    __slots__ = ('servers', 'neighbors', 'base_cost', 'rt', 'rt_ver', 'via', 'snap', 'pkts',
+                 'last', 'user', 'my_ip', 'my_port', 'interval', 'wire', 'peer_fmt', 'mtu',
+                 'frag_id', 'frags', 'reasm_drops', 'delta', 'full_every', 'ticks', 'dirty',
+                 'tx_seq', 'rx_seq', 'need_full', 'holddown', 'trigger', 'pend_links',
+                 'horizon', 'inf', 'nvec', 'dead_mult', 'dead_gran', 'deadline', 'dheap',
+                 'wake', 'sock', 'send_pool', 'clock', 'metrics', 'rt_when', 'last_change',
+                 'stop', 'lock', 'by_addr', 'src_check', 'rx_rate', 'rx_burst', 'buckets',
+                 'damp_half', 'penalty', 'zlevel', 'zmin', 'checkpoint', 'ck_every', 'stale',
+                 'warm', 'profiler', 'capture', 'timer', 'dead_timer', 'transport')
+
+    def __init__(self, fields):
+        for k, v in fields.items():
+            setattr(self, k, v)
+
+    def __getitem__(self, k):
+        try:
+            return getattr(self, k)
+        except AttributeError:
+            raise KeyError(k) from None
+
+    def __setitem__(self, k, v):
+        try:
+            setattr(self, k, v)
+        except AttributeError:
+            raise KeyError(k) from None
+
+    def __contains__(self, k):
+        return k in self.__slots__ and hasattr(self, k)
+
+    def get(self, k, default=None):
+        return getattr(self, k, default)
+
+'''
+
+    Class: ArrayRT
+        Array-backed routing table for large topologies. Server IDs map to dense indices and
+        next hop / cost live in two parallel vectors (NumPy when installed, otherwise the
+        array module). Reads and writes like the dict of (hop, cost) tuples, so display(),
+        data_pckt() and invalidate_routes() work on either. With NumPy, ids below LUT_MAX
+        are found through an int32 lookup vector instead of a dict - about 30 bytes a route.
+
+'''
+class ArrayRT:
+    def __init__(self):
+        # index -> server id (packed), server id -> index for ids the lookup vector can't hold
+        self.ids = array('q')
+        self.pos = {}
+        if np is not None:
+            self.hop = np.full(16, -1, dtype=np.int64)
+            self.cost = np.full(16, INF, dtype=np.int64)
+            # server id -> index (-1 unknown) for ids below LUT_MAX
+            self.lut = np.full(16, -1, dtype=np.int32)
+        else:
+            self.hop = array('q')
+            self.cost = array('q')
+            self.lut = None
+
+    # index of a server id, None when unknown
+    def find(self, d):
+        lut = self.lut
+        if lut is not None and 0 <= d < LUT_MAX:
+            if d < len(lut):
+                i = lut[d]
+                if i >= 0:
+                    return int(i)
+            return None
+        return self.pos.get(d)
+
+    # new destination - index at the end of the vectors
+    def add(self, d):
+        if d < 0:
+            raise ValueError(f"bad server id {d}")
+        i = len(self.ids)
+        self.ids.append(d)
+        if np is None:
+            self.pos[d] = i
+            self.hop.append(-1)
+            self.cost.append(INF)
+            return i
+        # double the vectors when full
+        if i >= len(self.hop):
+            self.hop = np.concatenate((self.hop, np.full(len(self.hop), -1, dtype=np.int64)))
+            self.cost = np.concatenate((self.cost, np.full(len(self.cost), INF, dtype=np.int64)))
+        if d >= LUT_MAX:
+            self.pos[d] = i
+        else:
+            if d >= len(self.lut):
+                grow = max(d + 1, 2 * len(self.lut)) - len(self.lut)
+                self.lut = np.concatenate((self.lut, np.full(grow, -1, dtype=np.int32)))
+            self.lut[d] = i
+        return i
+
+    # indices for a vector of server ids, unknown ids are added (NumPy only)
+    def index(self, dests):
+        if len(dests) and 0 <= dests.min() and dests.max() < len(self.lut):
+            idx = self.lut[dests].astype(np.int64)
+            missing = np.flatnonzero(idx < 0).tolist()
+        # ids past the lookup vector - one at a time
+        else:
+            idx = np.full(len(dests), -1, dtype=np.int64)
+            missing = range(len(dests))
+        for k in missing:
+            d = int(dests[k])
+            i = self.find(d)
+            idx[k] = self.add(d) if i is None else i
+        return idx
+
+    def __getitem__(self, d):
+        i = self.find(d)
+        if i is None:
+            raise KeyError(d)
+        return (int(self.hop[i]), int(self.cost[i]))
+
+    def __setitem__(self, d, value):
+        i = self.find(d)
+        if i is None:
+            i = self.add(d)
+        self.hop[i], self.cost[i] = value
+
+    def get(self, d, default=None):
+        i = self.find(d)
+        if i is None:
+            return default
+        return (int(self.hop[i]), int(self.cost[i]))
+
+    def __contains__(self, d):
+        return self.find(d) is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def keys(self):
+        return self.ids.tolist()
+
+    def items(self):
+        n = len(self.ids)
+        return zip(self.ids.tolist(), zip(self.hop[:n].tolist(), self.cost[:n].tolist()))
+
+    # copy for reading (snapshot)
+    def copy(self):
+        rt = ArrayRT()
+        rt.ids, rt.pos = array('q', self.ids), dict(self.pos)
+        rt.hop, rt.cost = self.hop[:], self.cost[:]
+        if np is not None:
+            rt.hop, rt.cost, rt.lut = self.hop.copy(), self.cost.copy(), self.lut.copy()
+        return rt
+
+'''
+
+    Class: NbrVec
+        Cached neighbor vector for the NumPy engine - costs aligned with the ArrayRT indices
+        (INF where nothing was advertised). Reads like the cached dict in state['nvec'].
+
+'''
+class NbrVec:
+    def __init__(self, rt):
+        self.rt = rt
+        self.cost = np.full(len(rt.hop), INF, dtype=np.int64)
+
+    # grow with the routing table
+    def fit(self):
+        if len(self.cost) < len(self.rt.hop):
+            grow = len(self.rt.hop) - len(self.cost)
+            self.cost = np.concatenate((self.cost, np.full(grow, INF, dtype=np.int64)))
+
+    def get(self, d, default=None):
+        i = self.rt.find(d)
+        if i is None or i >= len(self.cost) or self.cost[i] >= INF:
+            return default
+        return int(self.cost[i])
+
+    def __contains__(self, d):
+        return self.get(d) is not None
+
+    def __iter__(self):
+        ids = self.rt.ids
+        n = min(len(ids), len(self.cost))
+        return iter([ids[i] for i in np.flatnonzero(self.cost[:n] < INF).tolist()])
+
+'''
+
+    Class: PairVec
+        (dest, cost) pairs of a binary packet, left in the decoded array. Reads like the
+        json 'rt' dictionary (items, keys, len) and the NumPy engine uses the array directly.
+
+'''
+class PairVec:
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def __len__(self):
+        return len(self.pairs) // 2
+
+    def __iter__(self):
+        return iter(self.pairs[0::2])
+
+    def keys(self):
+        return self.pairs[0::2]
+
+    def values(self):
+        return self.pairs[1::2]
+
+    def items(self):
+        return zip(self.pairs[0::2], self.pairs[1::2])
 
 '''
 
@@ -32,6 +362,22 @@ interval = 0
 
         Usage Example:
             python3 dv.py -t <filename> -i 2
+            python3 dv.py -t <filename> -i 2 -f json
+            python3 dv.py -t <filename> -i 2 -m 1400
+            python3 dv.py -t <filename> -i 2 -d --full-every 30
+            python3 dv.py -t <filename> -i 30 --holddown 0.5
+            python3 dv.py -t <filename> -i 2 --horizon poison --infinity 16
+            python3 dv.py -t <filename> -i 2 -e array
+            python3 dv.py -t <filename> -i 2 --mode async --ids 1,2,3
+            python3 dv.py -t <filename> -i 2 --mode proc --ids all --procs 4
+            python3 dv.py -t <filename> -i 2 --stats-port 9000
+            python3 dv.py -t <filename> -i 2 --send-threads 4
+            python3 dv.py -t <filename> -i 2 --dead-mult 5 --dead-gran 0.1
+            python3 dv.py -t <filename> -i 2 --capture cap_{id}.log
+            python3 dv.py -t <filename> -i 2 --rx-rate 50 --damp-half 15
+            python3 dv.py -t <filename> -i 2 --checkpoint dv_{id}.ck
+            python3 dv.py -t <filename> -i 2 --seed <global topology>
+            python3 dv.py -t <filename> -i 2 --compress 6 --compress-min 512
 
 '''
 def p_args():
@@ -41,12 +387,75 @@ def p_args():
     ap.add_argument('-t','--topology', required=True)
     # required for updates
     ap.add_argument('-i','--interval', type=int, required=True)
+    # wire format - bin is only used once the neighbor advertises it
+    ap.add_argument('-f','--format', choices=('json','bin'), default='bin')
+    # largest datagram sent - bigger updates are split into fragments
+    ap.add_argument('-m','--mtu', type=int, default=MAX_UDP)
+    # routing table engine - array is vectorized with NumPy
+    ap.add_argument('-e','--engine', choices=('dict','array'), default='dict')
+    # incremental updates - only changed routes, full table every few intervals
+    ap.add_argument('-d','--delta', action='store_true')
+    ap.add_argument('--full-every', type=int, default=10)
+    # triggered updates - route changes within the hold-down window share one send
+    ap.add_argument('--holddown', type=float, default=0.2)
+    # split horizon / poisoned reverse and the largest usable path cost
+    ap.add_argument('--horizon', choices=('none','split','poison'), default='none')
+    ap.add_argument('--infinity', type=int, default=INF)
+    # asyncio event loop instead of the rx/tx threads, can host several server ids
+    ap.add_argument('--mode', choices=('thread','async','proc'), default='thread')
+    ap.add_argument('--ids', default=None)
+    # proc mode - worker processes, each hosts a shard of --ids on its own event loop
+    ap.add_argument('--procs', type=int, default=os.cpu_count() or 1)
+    # local UDP port answering with the metrics as json (async --ids: port + index)
+    ap.add_argument('--stats-port', type=int, default=None)
+    # sender threads for large neighbor fan-outs (0 sends from the calling thread)
+    ap.add_argument('--send-threads', type=int, default=0)
+    # neighbor declared dead after dead-mult intervals of silence, checked to dead-gran seconds
+    ap.add_argument('--dead-mult', type=float, default=3)
+    ap.add_argument('--dead-gran', type=float, default=0.05)
+    # write received datagrams to a file for replay.py ({id} - server id)
+    ap.add_argument('--capture', default=None)
+    # receive protection - sender address check, updates per second per neighbor (0 off)
+    # and route flap damping half-life in seconds (0 off)
+    ap.add_argument('--no-src-check', action='store_true')
+    ap.add_argument('--rx-rate', type=float, default=0)
+    ap.add_argument('--rx-burst', type=float, default=0)
+    ap.add_argument('--damp-half', type=float, default=0)
+    # warm start - table saved on exit/crash and every few intervals, loaded at start
+    ap.add_argument('--checkpoint', default=None)
+    ap.add_argument('--checkpoint-every', type=int, default=10)
+    # warm start from the shortest paths of a global topology (oracle.py)
+    ap.add_argument('--seed', default=None)
+    # zlib level (0 off) for packets of at least --compress-min bytes
+    ap.add_argument('--compress', type=int, choices=range(10), default=0)
+    ap.add_argument('--compress-min', type=int, default=1024)
 
     return ap.parse_args()
+'''
+
+    Class: TopologyError
+        Topology file that cannot be used - message names the file and line
+
+'''
+class TopologyError(ValueError):
+    pass
+
+'''
+
+    Class: Topology
+        Loaded topology (load_top) - read-only
+            servers: server_ID -> (ip, port), read-only mapping
+            rows: tuple of links (server1, server2, cost) as strings, like read_top()
+            first: first server ID in file
+            num_links: link count from the file (rows can be fewer when filtered)
+
+'''
+Topology = namedtuple('Topology', ('servers', 'rows', 'first', 'num_links'))
+
 '''
 
     Command: def read_top(): 
-        Reads and processes the topology file
+        Reads and processes the topology file (every link row, see load_top())
         
     Returns:
         servers: dictionary of server_ID : (ip,port)
@@ -55,56 +464,138 @@ def p_args():
 
 '''
 def read_top(path):
-    # directory prefix
-    path = "./" + path
+    top = load_top(path)
+    return dict(top.servers), list(top.rows), top.first
+
+'''
+
+    Command: def load_top():
+        Streams the topology file line by line (memory-mapped when use_mmap, or when the file
+        is at least MMAP_MIN bytes and use_mmap is None) and checks the counts, ids, addresses
+        and costs as it goes. With nodes (server ids) and/or own (the first server) only the
+        link rows touching those servers are kept, so a server of a huge topology does not
+        hold the whole edge list. Lines after the counted links are ignored.
+
+        Usage Example:
+            top = load_top('topology.txt', own=True)
+            st = state(top.servers, top.rows, 2, top.first)
+
+    Returns:
+        Topology, raises TopologyError on a missing or bad file
+
+'''
+def load_top(path, nodes=None, own=False, use_mmap=None):
     try:
-        # read lines from file
-        with open(path,'r') as f:
-            lines = f.readlines()
-    # file not found
-    except FileNotFoundError:
-        print('File not found:',path)
-        return
-        
-    # remove blank lines/comments
-    data = []
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('#'):
-            data.append(line)
-
-    # assign variables - counts
-    num_servers = int(data[0])
-    num_neighbors = int(data[1])
-    # track first server ID
-    first_server_id = None
-    
-    # assign server dictionary
-    for i in range(2, 2 + num_servers):
-        line = data[i].split()
-        srv_id = int(line[0])
-        ip = line[1]
-        port = int(line[2])
+        f = open(path, 'rb')
+    except OSError as e:
+        raise TopologyError(f"{path}: {e.strerror}") from None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap is None:
+            use_mmap = size >= MMAP_MIN
+        # mmap of an empty file fails - nothing to map anyway
+        src = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap and size else f
+        try:
+            return parse_top(path, iter(src.readline, b''), nodes, own)
+        finally:
+            if src is not f:
+                src.close()
+
+# helper function - parses the topology lines (bytes) for load_top()
+def parse_top(path, lines, nodes, own):
+    lines = top_lines(lines)
+
+    # next line or a clear error when the file ends early
+    def nxt(what):
+        for no, fields in lines:
+            return no, fields
+        raise TopologyError(f"{path}: file ends before {what}")
+
+    def bad(no, msg):
+        return TopologyError(f"{path}:{no}: {msg}")
+
+    # fields of a line for messages
+    def text(fields):
+        return b' '.join(fields).decode('utf-8', 'replace')
+
+    # counts
+    counts = []
+    for what in ('server count', 'link count'):
+        no, fields = nxt(f"the {what}")
+        if len(fields) != 1 or not fields[0].isdigit():
+            raise bad(no, f"expected the {what}, got {text(fields)!r}")
+        counts.append(int(fields[0]))
+    num_servers, num_links = counts
+
+    # servers - id ip port
+    servers = {}
+    first = None
+    for k in range(num_servers):
+        no, fields = nxt(f"server {k + 1} of {num_servers}")
+        if len(fields) != 3:
+            raise bad(no, f"expected 'id ip port', got {text(fields)!r}")
+        srv_id, ip, port = fields
+        try:
+            srv_id, ip, port = int(srv_id), ip.decode('ascii'), int(port)
+            socket.inet_aton(ip)
+        except (ValueError, OSError):
+            raise bad(no, f"bad server line {text(fields)!r}") from None
+        if srv_id < 0 or not 0 < port < 65536:
+            raise bad(no, f"server id or port out of range {text(fields)!r}")
+        if srv_id in servers:
+            raise bad(no, f"duplicate server id {srv_id}")
+        servers[srv_id] = (ip, port)
         # store the first server id
-        if first_server_id is None:
-            first_server_id = srv_id
-        # add entry for server id
-        servers.update({srv_id:(ip,port)})
-        
-    # assign remaining lines to rc
-    for j in range(2 + num_servers, 2 + num_servers + num_neighbors):
-        line = data[j].split()
-        rc.append(line)
-        
-    return servers, rc, first_server_id
+        if first is None:
+            first = srv_id
+
+    # links - server1 server2 cost, only the ones asked for
+    keep = set(nodes or ())
+    if own:
+        keep.add(first)
+    rows = []
+    k = 0
+    for no, fields in islice(lines, num_links):
+        k += 1
+        if len(fields) != 3:
+            raise bad(no, f"expected 'server1 server2 cost', got {text(fields)!r}")
+        try:
+            s1, s2 = int(fields[0]), int(fields[1])
+            if fields[2].lower() != b'inf' and int(fields[2]) < 0:
+                raise ValueError
+        except ValueError:
+            raise bad(no, f"bad link line {text(fields)!r}") from None
+        if s1 not in servers or s2 not in servers:
+            raise bad(no, f"link to unknown server {s1 if s1 not in servers else s2}")
+        # only decoded when kept
+        if not keep or s1 in keep or s2 in keep:
+            rows.append(tuple(v.decode('ascii') for v in fields))
+    if k < num_links:
+        raise TopologyError(f"{path}: file ends before link {k + 1} of {num_links}")
+
+    # lines after the counted links are ignored, like the original reader
+    return Topology(MappingProxyType(servers), tuple(rows), first, num_links)
+
+# helper function - numbered fields (bytes) of each line, without blank lines/comments
+def top_lines(lines):
+    for no, line in enumerate(lines, 1):
+        fields = line.split()
+        if fields and not fields[0].startswith(b'#'):
+            yield no, fields
 '''
 
     Command: def state(): 
         Sets up information for the distance vector server. Depends on servers, rc and interval
-        in order to create the socket, neighbors, routing table and state data
+        in order to create the socket, neighbors, routing table and state data. A ready-made
+        sock (anything with sendto) and clock can be passed in, e.g. by the simulator
 
 '''
-def state(servers, rc, interval, first_server_id):
+def state(servers, rc, interval, first_server_id, wire='bin', mtu=MAX_UDP, delta=False,
+          full_every=10, holddown=0.2, horizon='none', infinity=INF, engine='dict',
+          send_threads=0, dead_mult=3, dead_gran=0.05, capture=None,
+          src_check=True, rx_rate=0.0, rx_burst=0, damp_half=0.0, checkpoint=None,
+          checkpoint_every=10, seed=None, compress=0, compress_min=1024, sock=None,
+          clock=time.monotonic):
     # user server ID 
     user = first_server_id
     my_ip, my_port = servers[user]
@@ -113,8 +604,8 @@ def state(servers, rc, interval, first_server_id):
     for row in rc:
         s1, s2, c  = row
         s1, s2  = int(s1), int(s2)
-        # if cost is infinity - set to INF
-        if c.lower() == 'inf':
+        # if cost is infinity (or at --infinity) - set to INF
+        if c.lower() == 'inf' or int(c) >= min(int(infinity), INF):
             cost = INF 
         else:
             cost = int(c)
@@ -125,7 +616,7 @@ def state(servers, rc, interval, first_server_id):
             neighbors[s1] = cost
     # routing table for servers
     base_cost = dict(neighbors)
-    rt = {}
+    rt = ArrayRT() if engine == 'array' else {}
     for srv_id in servers:
         # user has 0 cost
         if srv_id == user:
@@ -136,56 +627,265 @@ def state(servers, rc, interval, first_server_id):
         # all others set to INF 
         else:
             rt[srv_id] = (-1, INF)
+    # next hop -> destinations routed through it
+    via = {}
+    for srv_id, (hop, cost) in rt.items():
+        if hop != -1:
+            via.setdefault(hop, set()).add(srv_id)
     # UDP socket for sending/receiving
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((my_ip, my_port))
-    sock.settimeout(1.0)
+    if sock is None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((my_ip, my_port))
+        sock.settimeout(1.0)
+        # room for bursts of fragments from large tables (best effort)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError:
+            pass
     # track when neighbor heard from last
     last = {n: 0.0 for n in neighbors}
+    # wire format per neighbor - json until neighbor shows it speaks bin
+    peer_fmt = {n: 'json' for n in neighbors}
     # state dictionary
-    state = {
+    state = NodeState({
         'servers' : servers,
         'neighbors' : neighbors,
         'base_cost' : base_cost,
         'rt' : rt,
+        'rt_ver' : 0,
+        'via' : via,
+        'snap' : (None, None),
         'pkts' : 0,
         'last' : last,
         'user' : user,
         'my_ip': my_ip,
         'my_port' : my_port,
         'interval' : int(interval),
+        'wire' : wire,
+        'peer_fmt' : peer_fmt,
+        'mtu' : max(FRAG.size + 1, min(int(mtu), MAX_UDP)),
+        'frag_id' : 0,
+        'frags' : {},
+        'reasm_drops' : 0,
+        'delta' : bool(delta),
+        'full_every' : int(full_every),
+        'ticks' : 0,
+        'dirty' : {n: set() for n in neighbors},
+        'tx_seq' : {n: 0 for n in neighbors},
+        'rx_seq' : {},
+        'need_full' : set(),
+        'holddown' : max(0.0, float(holddown)),
+        'trigger' : threading.Event(),
+        'pend_links' : [],
+        'horizon' : horizon,
+        'inf' : min(int(infinity), INF),
+        'nvec' : {n: {} for n in neighbors},
+        'dead_mult' : max(0.0, float(dead_mult)),
+        'dead_gran' : max(0.0, float(dead_gran)),
+        'deadline' : {},
+        'dheap' : [],
+        'wake' : threading.Event(),
+        'by_addr' : {addr: srv_id for srv_id, addr in servers.items()},
+        'src_check' : bool(src_check),
+        'rx_rate' : max(0.0, float(rx_rate)),
+        'rx_burst' : max(1.0, float(rx_burst or 2 * rx_rate)),
+        'buckets' : {},
+        'damp_half' : max(0.0, float(damp_half)),
+        'penalty' : {},
+        'zlevel' : max(0, min(int(compress), 9)),
+        'zmin' : max(0, int(compress_min)),
+        'checkpoint' : checkpoint.replace('{id}', str(user)) if checkpoint else None,
+        'ck_every' : int(checkpoint_every),
+        'stale' : set(),
+        'warm' : None,
+        'profiler' : None,
+        'capture' : None,
         'sock' : sock,
+        'send_pool' : ThreadPoolExecutor(send_threads, thread_name_prefix='send')
+                      if send_threads > 0 else None,
+        'clock' : clock,
+        'metrics' : {
+            'rx_pkts' : {},
+            'rx_bytes' : {},
+            'tx_pkts' : {},
+            'tx_bytes' : {},
+            'tx_err' : {},
+            'tx_err_last' : {},
+            'decode_err' : 0,
+            'shed_addr' : 0,
+            'shed_spoof' : 0,
+            'shed_rate' : {},
+            'damped' : 0,
+            'bf_calls' : 0,
+            'routes_changed' : 0,
+            'snd_calls' : 0,
+            'snd_time' : 0.0,
+            'snd_max' : 0.0,
+            'zip_pkts' : 0,
+            'zip_skip' : 0,
+            'zip_in' : 0,
+            'zip_out' : 0,
+            'zip_time' : 0.0,
+            'unzip_pkts' : 0,
+            'unzip_time' : 0.0,
+            'start' : clock()
+        },
+        'rt_when' : {},
+        'last_change' : clock(),
         'stop' : threading.Event(),
-        'lock' : threading.Lock()
-    }
-    
+        'lock' : TimedLock()
+    })
+    # writers publish the snapshot as they release the lock
+    state.lock.on_release = lambda: publish(state)
+    # warm start from the last checkpoint, or from the shortest paths of a global topology
+    warm = state['checkpoint'] is not None and load_checkpoint(state, state['checkpoint'])
+    if seed and not warm:
+        seed_oracle(state, seed)
+    # every neighbor has until the first deadline to be heard from
+    now = clock()
+    for n in neighbors:
+        arm_neigh(state, n, now)
+    # record what is received ({id} in the path is the server id)
+    if capture:
+        open_capture(state, capture)
+
     return state
 '''
 
+    Command: def set_route(): writes one routing table entry (caller holds the lock), marks
+                              the destination as changed for incremental updates and wakes
+                              the sender for a triggered update. Keeps the next hop index
+                              (state['via']) in step with the table.
+
+'''
+def set_route(state, dest, hop, cost):
+    old = state.rt.get(dest)
+    if old == (hop, cost):
+        return
+    state.rt[dest] = (hop, cost)
+    # next hop changed
+    if old is None or old[0] != hop:
+        move_via(state.via, dest, -1 if old is None else old[0], hop)
+    # new version for snapshot() readers
+    state.rt_ver += 1
+    # metrics - when the route last changed
+    now = state.clock()
+    state.metrics['routes_changed'] += 1
+    state.rt_when[dest] = state.last_change = now
+    # resend this destination to every neighbor
+    if state.delta:
+        for dirty in state.dirty.values():
+            dirty.add(dest)
+    # flapping route - good news waits for the periodic update, worse costs always go out
+    if state.damp_half > 0 and flap(state, dest, now) and old is not None and cost <= old[1]:
+        state.metrics['damped'] += 1
+        return
+    # triggered update
+    if not state.trigger.is_set():
+        state.trigger.set()
+
+# helper function - set_route() for many ArrayRT indices at once (NumPy engine)
+def set_routes(state, idx, hop, costs):
+    rt = state.rt
+    old = rt.hop[idx]
+    old_cost = rt.cost[idx]
+    rt.hop[idx] = hop
+    rt.cost[idx] = costs
+    state.rt_ver += 1
+    dests = [rt.ids[i] for i in idx.tolist()]
+    # next hop index - only the entries whose hop changed
+    new = rt.hop[idx]
+    for k in np.flatnonzero(old != new).tolist():
+        move_via(state.via, dests[k], int(old[k]), int(new[k]))
+    # metrics - when the routes last changed
+    now = state.last_change = state.clock()
+    state.metrics['routes_changed'] += len(dests)
+    state.rt_when.update(dict.fromkeys(dests, now))
+    if state.delta:
+        for dirty in state.dirty.values():
+            dirty.update(dests)
+    # only flapping routes with good news - wait for the periodic update
+    if state.damp_half > 0:
+        better = (rt.cost[idx] <= old_cost).tolist()
+        damped = sum([flap(state, d, now) and ok for d, ok in zip(dests, better)])
+        state.metrics['damped'] += damped
+        if damped == len(dests):
+            return
+    if not state.trigger.is_set():
+        state.trigger.set()
+
+# helper function - moves a destination between next hops in the via index (-1 is no hop)
+def move_via(via, dest, old, new):
+    if old != -1:
+        dests = via.get(old)
+        if dests is not None:
+            dests.discard(dest)
+            if not dests:
+                del via[old]
+    if new != -1:
+        via.setdefault(new, set()).add(dest)
+
+'''
+
+    Command: def snapshot():
+        Read-only copy of the routing table for readers (display, data_pckt, metrics) so they
+        do not hold the lock while printing or encoding. set_route()/set_routes() bump
+        state['rt_ver'] and publish() swaps in a new copy when the writer releases the lock,
+        so readers just take the current reference. Readers must not modify it. Not for
+        callers that already hold the lock.
+
+'''
+def snapshot(state):
+    # published version - no lock needed (the tuple is swapped in one assignment)
+    key, rt = state.snap
+    if key == (state.rt_ver, len(state.rt)):
+        return rt
+    # changed without the lock (setup) - publishes on release
+    with state.lock:
+        pass
+    return state.snap[1]
+
+# helper function - copies the routing table for snapshot() readers once per change (caller
+# holds the lock, run by the lock on release)
+def publish(state):
+    key = (state.rt_ver, len(state.rt))
+    if state.snap[0] != key:
+        state.snap = (key, state.rt.copy())
+'''
+
     Command: def handle_link_update(): processes the cost between servers and updates accordingly
-                                (neighbor, base cost, routing)
+                                (neighbor, base cost, routing) for a list of link updates, under
+                                one lock. Returns the neighbors whose link changed (empty if
+                                none of the links are ours)
 
 '''
-def handle_link_update(state, link_info):
-    # ids and new cost from update
-    server1 = int(link_info['server1'])
-    server2 = int(link_info['server2'])
-    cost = int(link_info['cost'])
+def handle_link_update(state, links):
+    changed = set()
     # update safely with lock 
-    with state['lock']:
-        if state['user'] == server1 and server2 in state['neighbors']:
-            state['neighbors'][server2] = cost
-            state['base_cost'][server2] = cost
-            if cost >= INF:
-                # Link is disabled, invalidate routes through it
-                state['rt'][server2] = (-1, INF)
-                invalidate_routes(state, server2)
-            else:
-                state['rt'][server2] = (server2, cost)
-        elif state['user'] == server2 and server1 in state['neighbors']:
-            state['neighbors'][server1] = cost
-            state['base_cost'][server1] = cost
-            state['rt'][server1] = (server1, cost)
+    with state.lock:
+        for link_info in links:
+            # ids and new cost from update
+            server1 = int(link_info['server1'])
+            server2 = int(link_info['server2'])
+            cost = int(link_info['cost'])
+            if state.user == server1 and server2 in state.neighbors:
+                state.neighbors[server2] = cost
+                state.base_cost[server2] = cost
+                if cost >= INF:
+                    # Link is disabled, invalidate routes through it
+                    set_route(state, server2, -1, INF)
+                    invalidate_routes(state, server2)
+                else:
+                    set_route(state, server2, server2, cost)
+                    link_changed(state, server2)
+                changed.add(server2)
+            elif state.user == server2 and server1 in state.neighbors:
+                state.neighbors[server1] = cost
+                state.base_cost[server1] = cost
+                set_route(state, server1, server1, cost)
+                link_changed(state, server1)
+                changed.add(server1)
+    return changed
 '''
 
 
@@ -193,27 +893,439 @@ def handle_link_update(state, link_info):
                                     unreachable
             if cost >= INF:
                 # Link is disabled, invalidate routes through it
-                state['rt'][server1] = (-1, INF)
+                state.rt[server1] = (-1, INF)
                 invalidate_routes(state, server1)
             else:
-                state['rt'][server1] = (server1, cost)
+                state.rt[server1] = (server1, cost)
 
 '''
-def update_neighbor_status(state, from_server):
-    with state['lock']:
+def update_neighbor_status(state, from_server, wire=None, nbytes=0):
+    # True when the neighbor comes back from INF
+    revived = False
+    with state.lock:
         # packet count
-        state['pkts'] += 1
-        if from_server in state['neighbors']:
-            # update last heard time
-            state['last'][from_server] = time.time()
+        state.pkts += 1
+        # metrics per sender
+        m = state.metrics
+        m['rx_pkts'][from_server] = m['rx_pkts'].get(from_server, 0) + 1
+        m['rx_bytes'][from_server] = m['rx_bytes'].get(from_server, 0) + nbytes
+        if from_server in state.neighbors:
+            # update last heard time and push back its dead neighbor deadline
+            state.last[from_server] = state.clock()
+            arm_neigh(state, from_server, state.last[from_server])
+            # remember which wire format the neighbor understands
+            if wire is not None:
+                state.peer_fmt[from_server] = wire
             
             # Only revive if base_cost is not INF (not manually disabled)
-            if state['neighbors'][from_server] >= INF:
-                base = state['base_cost'].get(from_server, INF)
+            if state.neighbors[from_server] >= INF:
+                base = state.base_cost.get(from_server, INF)
                 # Don't revive if the base cost itself is INF
                 if base < INF:
-                    state['neighbors'][from_server] = base
-                    state['rt'][from_server] = (from_server, base)
+                    state.neighbors[from_server] = base
+                    set_route(state, from_server, from_server, base)
+                    # routes through it from its last known vector
+                    link_changed(state, from_server)
+                    # neighbor may have missed deltas while it was down
+                    state.need_full.add(from_server)
+                    revived = True
+    return revived
+
+'''
+
+    Command: def handle_pckt():
+        decodes a single datagram (json or binary), applies any link update, refreshes the
+        sender and runs DV on the advertised vector
+
+'''
+def handle_pckt(state, data, addr):
+    # decode and parse the packet
+    packet, fmt = decode_pckt(data)
+
+    # identify which server sent the packet + info about neighbors
+    from_server = int(packet['user'])
+    # the claimed id must be the server at the sending address
+    if state.src_check and state.by_addr.get(addr) != from_server:
+        state.metrics['shed_spoof'] += 1
+        return
+
+    neighbor_vector = packet['rt']
+
+    if packet.get('reason') == 'step':
+        print(f"RECEIVED MESSAGE FROM SERVER {addr}")
+
+    # single link update, or the list of a bulk update
+    links = packet.get('link_updates', [])
+    if 'link_update' in packet:
+        links = [packet['link_update']] + list(links)
+    link_upd = bool(links) and from_server in handle_link_update(state, links)
+
+    # json peers advertise binary support with the 'wire' key
+    if fmt == 'bin' or packet.get('wire') == 'bin':
+        wire = 'bin'
+    else:
+        wire = 'json'
+    # update the 'last' heard time from sender
+    revived = update_neighbor_status(state, from_server, wire, len(data))
+
+    # incremental updates - skip stale deltas, ask for a full table after a gap
+    apply, gap = True, False
+    if 'seq' in packet:
+        apply, gap = check_seq(state, from_server, int(packet['seq']), packet.get('full', False))
+
+    # call bell_ford() to apply distance vector updates
+    if apply:
+        bell_ford(state, from_server, neighbor_vector,
+                  full='seq' not in packet or packet.get('full', False),
+                  split=packet.get('split', False))
+
+    if state.delta:
+        # our cost to the sender changed - unchanged routes behind it were never resent,
+        # so both sides swap full tables
+        if link_upd:
+            with state.lock:
+                state.need_full.add(from_server)
+        want_full = gap or link_upd or revived
+        # neighbor lost some of our deltas - next update to it is the full table
+        if packet.get('resync'):
+            with state.lock:
+                state.need_full.add(from_server)
+            snd_update(state, to=from_server, resync=want_full)
+        elif want_full:
+            snd_update(state, to=from_server, resync=True)
+
+'''
+
+    Command: def check_seq():
+        Tracks the sequence number of incremental updates from each neighbor
+
+    Returns:
+        apply: False for a delta older than one already applied
+        gap: True when deltas were lost or reordered and a full table is needed
+
+'''
+def check_seq(state, from_server, seq, full):
+    rx_seq = state.rx_seq
+    with state.lock:
+        if from_server not in state.neighbors:
+            return True, False
+        last = rx_seq.get(from_server)
+        # full table - start counting again
+        if full:
+            rx_seq[from_server] = seq
+            return True, False
+        # no full table yet (we restarted) or missing deltas
+        if last is None or seq > last + 1:
+            rx_seq[from_server] = seq
+            return True, True
+        # stale delta - newer values already applied
+        if seq <= last:
+            return False, True
+        rx_seq[from_server] = seq
+        return True, False
+
+'''
+
+    Command: def rx_dgram():
+        handles one received datagram - fragments wait for the rest of the update,
+        whole packets go to handle_pckt(). The rate limit charges one token per update - the
+        packet itself or the first fragment of a large one - so fragmented updates are not
+        cut short.
+
+'''
+def rx_dgram(state, data, addr):
+    # raw datagram to the capture file
+    if state.capture is not None:
+        cap_write(state, CAP_PKT, data, addr)
+    # shed before decoding - unknown sender address, neighbor over its rate
+    src = state.by_addr.get(addr)
+    if src is None and state.src_check:
+        state.metrics['shed_addr'] += 1
+        return
+    # later fragments of an update are free (fragment index after magic and message id)
+    if (state.rx_rate > 0 and (data[:2] != FRAG_MAGIC or data[6:8] == b'\0\0')
+            and not take_token(state, addr if src is None else src)):
+        shed = state.metrics['shed_rate']
+        shed[src] = shed.get(src, 0) + 1
+        return
+    try:
+        # fragment of a large update - wait for the rest
+        if data[:2] == FRAG_MAGIC:
+            data = reasm(state, data, addr)
+            if data is None:
+                return
+        # compressed packet
+        if data[:2] == ZIP_MAGIC:
+            data = unzip_pckt(state, data)
+        handle_pckt(state, data, addr)
+    # bad json or malformed binary packet - counted, the caller drops it
+    except (ValueError, struct.error):
+        with state.lock:
+            state.metrics['decode_err'] += 1
+        raise
+
+# helper function - per neighbor token bucket (state.rx_rate updates a second, bursts of
+# state.rx_burst), False when the update should be dropped
+def take_token(state, key):
+    now = state.clock()
+    tokens, when = state.buckets.get(key, (state.rx_burst, now))
+    tokens = min(state.rx_burst, tokens + (now - when) * state.rx_rate)
+    if tokens < 1:
+        state.buckets[key] = (tokens, now)
+        return False
+    state.buckets[key] = (tokens - 1, now)
+    return True
+
+# helper function - route flap damping. Each change adds DAMP_STEP to the destination's
+# penalty, which halves every state.damp_half seconds. True while it is above DAMP_SUPPRESS
+# (the change is kept and advertised with the next periodic update, not right away).
+def flap(state, dest, now):
+    pen, when = state.penalty.get(dest, (0.0, now))
+    pen = pen * 0.5 ** ((now - when) / state.damp_half) + DAMP_STEP
+    state.penalty[dest] = (pen, now)
+    return pen > DAMP_SUPPRESS
+
+'''
+
+    Command: def open_capture():
+        Starts writing everything the server receives to a capture file (--capture) for
+        replay.py. File: CAP_MAGIC, header length and a json header (server id, interval,
+        options, clock at start), then records - CAP_REC (kind, clock, sender ip, sender
+        port, length) followed by the bytes:
+            CAP_PKT - a received datagram, as it came off the socket
+            CAP_CMD - a local command that changes routes (update, disable, crash)
+            CAP_RT  - the final routing table as json, written by close_capture()
+
+'''
+def open_capture(state, path):
+    f = open(path.replace('{id}', str(state['user'])), 'wb')
+    header = json.dumps({
+        'user' : state['user'],
+        'interval' : state['interval'],
+        'start' : state['clock'](),
+        'opts' : {
+            'wire' : state['wire'],
+            'mtu' : state['mtu'],
+            'delta' : state['delta'],
+            'full_every' : state['full_every'],
+            'holddown' : state['holddown'],
+            'horizon' : state['horizon'],
+            'infinity' : state['inf'],
+            'engine' : 'array' if isinstance(state['rt'], ArrayRT) else 'dict',
+            'dead_mult' : state['dead_mult'],
+            'dead_gran' : state['dead_gran'],
+            'src_check' : state['src_check'],
+            'rx_rate' : state['rx_rate'],
+            'rx_burst' : state['rx_burst'],
+            'damp_half' : state['damp_half']
+        },
+        # base costs and neighbor vectors of a warm start (checkpoint, --seed)
+        'warm' : state['warm']
+    }).encode('utf-8')
+    f.write(CAP_MAGIC + SEQ.pack(len(header)) + header)
+    state['capture'] = f
+
+# helper function - one capture record (a single write, so records from the rx thread and
+# the command thread do not interleave)
+def cap_write(state, kind, data, addr=('0.0.0.0', 0)):
+    f = state.capture
+    if f is not None:
+        f.write(CAP_REC.pack(kind, state.clock(), socket.inet_aton(addr[0]), addr[1],
+                             len(data)) + data)
+
+# helper function - final routing table record, closes the capture
+def close_capture(state):
+    f = state['capture']
+    if f is None:
+        return
+    rt = snapshot(state)
+    cap_write(state, CAP_RT, json.dumps({str(d): list(v) for d, v in rt.items()}).encode('utf-8'))
+    state['capture'] = None
+    f.close()
+
+'''
+
+    Command: def read_capture(): reads a capture file written by open_capture()
+
+    Returns:
+        header dictionary and a generator of (kind, clock, (ip, port), bytes) records
+
+'''
+def read_capture(path):
+    f = open(path, 'rb')
+    if f.read(len(CAP_MAGIC)) != CAP_MAGIC:
+        f.close()
+        raise ValueError(f"{path}: not a capture file")
+    size, = SEQ.unpack(f.read(SEQ.size))
+    header = json.loads(f.read(size))
+
+    def records():
+        with f:
+            while True:
+                head = f.read(CAP_REC.size)
+                # a capture cut short (killed server) ends at the last whole record
+                if len(head) < CAP_REC.size:
+                    return
+                kind, when, ip, port, n = CAP_REC.unpack(head)
+                data = f.read(n)
+                if len(data) < n:
+                    return
+                yield kind, when, (socket.inet_ntoa(ip), port), data
+    return header, records()
+
+'''
+
+    Command: def save_checkpoint():
+        Writes the cached neighbor vectors and the base link costs to the checkpoint file
+        (--checkpoint) for a warm start - the table is rebuilt from them. Links at INF
+        (disable, crash) are left out, so a restart comes back with the topology cost like
+        before. Each save writes its own temporary file in the same directory and renames
+        it, so a crash while saving keeps the previous checkpoint and saves from different
+        threads do not collide. File: CK_MAGIC, header length, json header (server id, time,
+        base costs, counts), then each vector as (dest, cost) - 64 bit ints, network byte
+        order. A failed save only prints a warning.
+
+'''
+def save_checkpoint(state):
+    path = state['checkpoint']
+    if path is None:
+        return
+    with state['lock']:
+        base = {n: c for n, c in state['base_cost'].items() if c < INF}
+        vecs = {n: [(d, vec.get(d, INF)) for d in vec] for n, vec in state['nvec'].items()}
+    parts = [array('q', [v for pair in vecs[n] for v in pair]) for n in vecs]
+    header = json.dumps({
+        'user' : state['user'],
+        'saved' : time.time(),
+        'base_cost' : {str(n): c for n, c in base.items()},
+        'nvec' : [[n, len(vecs[n])] for n in vecs]
+    }).encode('utf-8')
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(path) or '.')
+        with open(fd, 'wb') as f:
+            f.write(CK_MAGIC + SEQ.pack(len(header)) + header)
+            for part in parts:
+                if sys.byteorder == 'little':
+                    part.byteswap()
+                f.write(part.tobytes())
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Warning: checkpoint {path} not saved: {e}")
+        if tmp is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+'''
+
+    Command: def load_checkpoint():
+        Warm start (called by state()) - restores the base link costs and the neighbor vectors
+        from a checkpoint of this server, then rebuilds the table from them with reroute(), so
+        non-neighbors are reachable before the first update arrives. The restored vectors are
+        stale (state['stale']) until that neighbor sends a full table; a neighbor that never
+        answers is timed out like any other and its routes are dropped.
+
+    Returns:
+        True when a checkpoint was loaded
+
+'''
+def load_checkpoint(state, path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"Warning: {path}: {e.strerror}, starting cold.")
+        return False
+    if data[:len(CK_MAGIC)] != CK_MAGIC:
+        print(f"Warning: {path} is not a checkpoint, starting cold.")
+        return False
+    # parse all of it before touching the state - a damaged file starts cold
+    try:
+        off = len(CK_MAGIC)
+        size, = SEQ.unpack_from(data, off)
+        off += SEQ.size
+        header = json.loads(data[off:off + size])
+        off += size
+        if header['user'] != state['user']:
+            print(f"Warning: {path} belongs to server {header['user']}, starting cold.")
+            return False
+        vals = array('q')
+        vals.frombytes(data[off:])
+        if sys.byteorder == 'little':
+            vals.byteswap()
+        base = {int(n): int(c) for n, c in header['base_cost'].items()}
+        # older checkpoints also hold the table - rebuilt from the vectors, skipped
+        k = 3 * int(header.get('rt', 0))
+        vecs = {}
+        for n, count in header['nvec']:
+            pairs = vals[k:k + 2 * count]
+            k += 2 * count
+            vecs[int(n)] = dict(zip(pairs[0::2], pairs[1::2]))
+        if k != len(vals):
+            raise ValueError("size does not match the header")
+    except (ValueError, TypeError, KeyError, struct.error) as e:
+        print(f"Warning: {path} is damaged ({e}), starting cold.")
+        return False
+    warm_start(state, base, vecs)
+    return True
+
+'''
+
+    Command: def seed_oracle():
+        Warm start from a global topology (--seed) - the neighbor vectors come from the
+        shortest paths of oracle.py instead of a checkpoint. Stale until confirmed, like a
+        checkpoint.
+
+'''
+def seed_oracle(state, path):
+    import oracle
+    try:
+        top = load_top(path)
+    except TopologyError as e:
+        print(f"Warning: {e}, starting cold.")
+        return
+    if state['user'] not in top.servers:
+        print(f"Warning: server {state['user']} is not in {path}, starting cold.")
+        return
+    warm_start(state, {}, oracle.vectors(top.servers, top.rows, state['user'], state['inf']))
+
+'''
+
+    Command: def warm_start():
+        Applies a warm start (checkpoint, oracle seed) - base costs of links that are still in
+        the topology (keeps update/disable changes), then the provisional neighbor vectors,
+        cached like received ones and stale until the neighbor sends a full table. The table
+        is rebuilt from them. What was applied is kept in state['warm'] for the capture
+        header, so replay.py starts from the same table.
+
+'''
+def warm_start(state, base, vecs):
+    warm = {'base_cost': {}, 'nvec': {}}
+    for n, c in base.items():
+        if n in state['neighbors']:
+            state['base_cost'][n] = c
+            state['neighbors'][n] = c
+            set_route(state, n, n, c)
+            warm['base_cost'][str(n)] = c
+    dests = set()
+    for n, vec in vecs.items():
+        if n not in state['neighbors']:
+            continue
+        warm['nvec'][str(n)] = [[d, c] for d, c in vec.items()]
+        dests.update(vec)
+        if isinstance(state['rt'], ArrayRT) and np is not None:
+            nv = NbrVec(state['rt'])
+            idx = state['rt'].index(np.fromiter(vec.keys(), np.int64, len(vec)))
+            nv.fit()
+            nv.cost[idx] = np.fromiter(vec.values(), np.int64, len(vec))
+            vec = nv
+        state['nvec'][n] = vec
+        state['stale'].add(n)
+    reroute(state, dests)
+    state['warm'] = warm
 
 '''
 
@@ -223,112 +1335,421 @@ def update_neighbor_status(state, from_server):
 
 '''
 def rx(state):
-    while not state['stop'].is_set():
+    stop, sock = state.stop, state.sock
+    while not stop.is_set():
         try:
             # wait for incoming data
-            data, addr = state['sock'].recvfrom(1024)
-            # decode and parse the packet
-            packet = json.loads(data.decode('utf-8'))
-
-            # identify which server sent the packet + info about neighbors
-            from_server = int(packet['user'])
-            
-            neighbor_vector = packet['rt']
-
-            if packet.get('reason') == 'step':
-                print(f"RECEIVED MESSAGE FROM SERVER {addr}")
-
-            if 'link_update' in packet:
-                handle_link_update(state, packet['link_update'])
-
-            # update the 'last' heard time from sender
-            update_neighbor_status(state, from_server)
-
-            # call bell_ford() to apply distance vector updates
-            bell_ford(state, from_server, neighbor_vector)
+            data, addr = sock.recvfrom(RECV_BUF)
+            rx_dgram(state, data, addr)
         except socket.timeout:
+            # drop fragments that never completed
+            expire_frags(state)
             continue
-        except json.JSONDecodeError:
+        # bad json or malformed binary packet
+        except (ValueError, struct.error):
             continue 
         except OSError as e:
-            if e.winerror != 10054:  # Ignore "Connection reset by peer" error
+            if getattr(e, 'winerror', None) != 10054:  # Ignore "Connection reset by peer" error
                 print(f"Socket error: {e}")
         except Exception as e:
-            if not state['stop'].is_set():
+            if not stop.is_set():
                 print(f"Error receiving packet: {e}")
 
+'''
+
+    Command: def frag_pckt():
+        Splits an encoded packet that does not fit in one datagram (state['mtu']) into
+        numbered fragments. Small packets are returned unchanged.
+
+'''
+def frag_pckt(state, pckt):
+    if len(pckt) <= state.mtu:
+        return [pckt]
+    # payload bytes per fragment
+    size = state.mtu - FRAG.size
+    total = (len(pckt) + size - 1) // size
+    if total > 0xFFFF:
+        raise ValueError("update too large to fragment")
+    # message id shared by all fragments
+    with state.lock:
+        state.frag_id = (state.frag_id + 1) & 0xFFFFFFFF
+        msg_id = state.frag_id
+    return [FRAG.pack(FRAG_MAGIC, msg_id, i, total) + pckt[i * size:(i + 1) * size]
+            for i in range(total)]
+
+'''
+
+    Command: def zip_pckt():
+        Compresses an encoded packet with zlib (state['zlevel'], --compress) when it is at
+        least state['zmin'] bytes, in a ZIP_MAGIC envelope. Kept as is when compression is
+        off, the packet is small, or it does not get smaller. Every server of the network
+        needs --compress support to read the envelope. Counts bytes in/out and the CPU time
+        of this thread for the stats command.
+
+'''
+def zip_pckt(state, pckt):
+    if not state.zlevel or len(pckt) < state.zmin:
+        return pckt
+    start = time.thread_time()
+    out = ZIP_MAGIC + zlib.compress(pckt, state.zlevel)
+    took = time.thread_time() - start
+    with state.lock:
+        m = state.metrics
+        m['zip_pkts'] += 1
+        m['zip_in'] += len(pckt)
+        m['zip_time'] += took
+        # not worth it - sent uncompressed
+        if len(out) >= len(pckt):
+            m['zip_out'] += len(pckt)
+            m['zip_skip'] += 1
+            return pckt
+        m['zip_out'] += len(out)
+    return out
+
+'''
+
+    Command: def unzip_pckt():
+        Decompresses a ZIP_MAGIC envelope (whole packet, after reassembly). Output is capped
+        at ZIP_MAX bytes. Raises ValueError on a bad envelope, like a bad packet.
+
+'''
+def unzip_pckt(state, data):
+    start = time.thread_time()
+    z = zlib.decompressobj()
+    try:
+        out = z.decompress(memoryview(data)[len(ZIP_MAGIC):], ZIP_MAX)
+    except zlib.error as e:
+        raise ValueError(f"bad compressed packet: {e}") from None
+    if z.unconsumed_tail or not z.eof:
+        raise ValueError("compressed packet too large or truncated")
+    took = time.thread_time() - start
+    with state.lock:
+        m = state.metrics
+        m['unzip_pkts'] += 1
+        m['unzip_time'] += took
+    return out
+
+'''
+
+    Command: def reasm():
+        Collects fragments per (sender, message id). Returns the whole packet once the
+        last fragment arrives, otherwise None. Only called from the receive thread.
+        Deadlines are on state['clock'], so replay and the simulator expire on their time.
+
+'''
+def reasm(state, data, addr):
+    _, msg_id, idx, total = FRAG.unpack_from(data)
+    if idx >= total:
+        raise ValueError("bad fragment index")
+    now = state.clock()
+    expire_frags(state, now)
+    key = (addr, msg_id)
+    entry = state.frags.get(key)
+    if entry is None:
+        # deadline, fragment count, fragments received
+        entry = state.frags[key] = [now + reasm_timeout(state), total, {}]
+    entry[2][idx] = data[FRAG.size:]
+    if len(entry[2]) < entry[1]:
+        return None
+    del state.frags[key]
+    return b''.join(entry[2][i] for i in range(entry[1]))
+
+# helper function - how long to wait for missing fragments
+def reasm_timeout(state):
+    return max(1.0, state.interval)
+
+# helper function to drop incomplete reassemblies past their deadline
+def expire_frags(state, now=None):
+    if not state.frags:
+        return
+    if now is None:
+        now = state.clock()
+    for key in [k for k, entry in state.frags.items() if entry[0] < now]:
+        del state.frags[key]
+        state.reasm_drops += 1
+
 '''
 
     Command: def tx():
-        Handles periodic updates to neighbors, checks failed neighbors and implements interval update
+        Handles periodic updates to neighbors, checks failed neighbors and implements interval update.
+        A route change wakes it early (triggered update) - it waits out the hold-down window so a
+        burst of changes goes out as one update.
 
 '''
 def tx(state):
+    # time of the next periodic update
+    nxt = time.monotonic()
     # continuously listen for incoming packets
-    while not state['stop'].is_set():
-        # Check for dead neighbors
-        dead_neigh(state)
-        # wait for incoming data
-        snd_update(state)
-        # Sleep for the specified interval before sending the next update
-        # has 0.2 second minimum to prevent misinput from user commands
-        time.sleep(max(0.2, state['interval']))
+    while not state.stop.is_set():
+        now = time.monotonic()
+        if now >= nxt:
+            # Sleep for the specified interval before sending the next update
+            # has 0.2 second minimum to prevent misinput from user commands
+            nxt = now + max(0.2, state.interval)
+            # a failed update is logged - the thread keeps advertising
+            try:
+                periodic(state)
+            except Exception as e:
+                print(f"Error sending periodic update: {e}")
+            continue
+        # wait for the next interval or a route change
+        if not state.trigger.wait(nxt - now):
+            continue
+        # hold-down - collect the rest of the burst
+        if state.stop.wait(state.holddown):
+            break
+        state.trigger.clear()
+        try:
+            flush(state)
+        except Exception as e:
+            print(f"Error sending triggered update: {e}")
+
+'''
+
+    Command: def periodic():
+        One interval tick - sends the periodic update (dead neighbors have their own timer)
+
+'''
+def periodic(state):
+    state.ticks += 1
+    # forget damping penalties that have decayed away
+    if state.penalty:
+        with state.lock:
+            now = state.clock()
+            for d, (pen, when) in list(state.penalty.items()):
+                if pen * 0.5 ** ((now - when) / state.damp_half) < 1:
+                    del state.penalty[d]
+    # checkpoint every few intervals
+    if state.checkpoint and state.ck_every > 0 and state.ticks % state.ck_every == 0:
+        save_checkpoint(state)
+    # incremental updates still send the full table every few intervals
+    full = state.full_every > 0 and state.ticks % state.full_every == 0
+    # periodic update also carries anything pending
+    state.trigger.clear()
+    flush(state, full=full)
+
+'''
+
+    Command: def flush():
+        Sends one update carrying the queued link updates (update/disable/bulk), or a plain
+        routing update when nothing is queued. Several queued links go out together in the
+        link_updates list.
+
+'''
+def flush(state, full=False):
+    with state.lock:
+        links, state.pend_links = state.pend_links, []
+    if not links:
+        snd_update(state, full=full)
+    # incremental updates: ask neighbors for full tables
+    elif len(links) == 1:
+        snd_update(state, reason='update', link_update=links[0], full=full,
+                   resync=state.delta)
+    else:
+        snd_update(state, reason='update', link_updates=links, full=full,
+                   resync=state.delta)
+
+# helper function to queue link updates for the next (triggered) send
+def queue_link(state, *link_updates):
+    with state.lock:
+        state.pend_links.extend(link_updates)
+    state.trigger.set()
 
 '''
 
     Command: bell_ford():
         uses Bellman-Ford algorithm for distance vector updates, compares known cost to destination 
         and cost through a neighbor (sender). If new path is less, table is updated.
+        Costs at or above state['inf'] count as unreachable. A full table the sender marks as
+        split horizon (split) that leaves out a destination we reach through it withdraws
+        that route.
+        The vector is cached per neighbor (state['nvec']) so a route that gets worse can
+        switch to the best other neighbor right away.
 
 '''
-def bell_ford(state, snd, snd_rt):
+def bell_ford(state, snd, snd_rt, full=False, split=False):
     snd = int(snd)
-    with state['lock']:
+    # vectorized engine
+    if np is not None and isinstance(state.rt, ArrayRT):
+        return bell_ford_np(state, snd, snd_rt, full, split)
+    # path cost that counts as infinity, fields used in the loop
+    inf, user, rt = state.inf, state.user, state.rt
+    with state.lock:
+        state.metrics['bf_calls'] += 1
         # Use the DIRECT link cost to the sender, not the routing-table entry.
-        c2s = state['neighbors'].get(snd, INF)
+        c2s = state.neighbors.get(snd, INF)
+        # cached vector - a full table replaces it (and confirms a warm start), a delta is merged
+        vec = {} if full else state.nvec.get(snd, {})
+        if full:
+            state.stale.discard(snd)
+        if snd in state.neighbors:
+            state.nvec[snd] = vec
+        # routes through the sender that got worse
+        worse = []
 
         # Process each destination advertised by the sender
         for dstr, sndc in snd_rt.items():
             d = int(dstr)
             sndc = int(sndc)
+            vec[d] = sndc
 
-            if d == state['user']:
+            if d == user:
                 continue  # never update route to self from DV
 
             # Candidate cost via 'snd'
-            new = INF if (c2s >= INF or sndc >= INF) else (c2s + sndc)
+            new = INF if (c2s >= inf or sndc >= inf) else (c2s + sndc)
+            if new >= inf:
+                new = INF
 
-            cur_hop, cur_cost = state['rt'].get(d, (-1, INF))
+            cur_hop, cur_cost = rt.get(d, (-1, INF))
 
             # 1) Improve if strictly cheaper
             if new < cur_cost:
-                state['rt'][d] = (snd, new)
+                set_route(state, d, snd, new)
             # 2) Track increases (including to INF) when our current next hop is the sender
             elif cur_hop == snd and new != cur_cost:
-                state['rt'][d] = (snd, new)
+                set_route(state, d, snd, new)
+                if new > cur_cost:
+                    worse.append(d)
+
+        # sender's split horizon - routes through the sender it no longer advertises
+        if full and split:
+            for d in list(state.via.get(snd, ())):
+                if d != snd and d not in vec and state.rt[d][1] < INF:
+                    set_route(state, d, snd, INF)
+                    worse.append(d)
+
+        # another neighbor may now be cheaper
+        if worse:
+            reroute(state, worse)
+
+'''
 
+    Command: bell_ford_np():
+        Same update as bell_ford() for the NumPy ArrayRT engine - the whole advertised vector
+        is compared in one pass and only the destinations that change go through set_route()
 
+'''
+def bell_ford_np(state, snd, snd_rt, full=False, split=False):
+    inf = state.inf
+    dests, costs = vec_arrays(snd_rt)
+    with state.lock:
+        state.metrics['bf_calls'] += 1
+        rt = state.rt
+        c2s = state.neighbors.get(snd, INF)
+        idx = rt.index(dests)
+        # cached vector - a full table replaces it, a delta is merged
+        vec = state.nvec.get(snd)
+        if full:
+            state.stale.discard(snd)
+        if full or not isinstance(vec, NbrVec):
+            vec = NbrVec(rt)
+        vec.fit()
+        vec.cost[idx] = costs
+        if snd in state.neighbors:
+            state.nvec[snd] = vec
+
+        # Candidate cost via 'snd'
+        new = c2s + costs
+        new[(costs >= inf) | (new >= inf)] = INF
+        if c2s >= inf:
+            new[:] = INF
+        cur_hop = rt.hop[idx]
+        cur_cost = rt.cost[idx]
+        # 1) strictly cheaper, 2) increase/decrease through the current next hop
+        better = new < cur_cost
+        track = (cur_hop == snd) & (new != cur_cost) & ~better
+        # never update route to self from DV
+        own = dests != state.user
+        changed = np.flatnonzero((better | track) & own)
+        worse = np.flatnonzero(track & (new > cur_cost) & own)
+
+        ids = rt.ids
+        if len(changed):
+            set_routes(state, idx[changed], snd, new[changed])
+        worse = [ids[idx[i]] for i in worse.tolist()]
+
+        # sender's split horizon - routes through the sender it no longer advertises
+        if full and split:
+            n = len(ids)
+            gone = np.flatnonzero((rt.hop[:n] == snd) & (rt.cost[:n] < INF) & (vec.cost[:n] >= INF))
+            for i in gone.tolist():
+                if ids[i] != snd:
+                    set_route(state, ids[i], snd, INF)
+                    worse.append(ids[i])
+
+        # another neighbor may now be cheaper
+        if worse:
+            reroute(state, worse)
+
+# helper function - advertised vector as NumPy (dests, costs)
+def vec_arrays(snd_rt):
+    if isinstance(snd_rt, PairVec):
+        pairs = np.frombuffer(snd_rt.pairs, dtype=np.uint32).astype(np.int64)
+        return pairs[0::2], pairs[1::2]
+    n = len(snd_rt)
+    dests = np.fromiter(map(int, snd_rt.keys()), np.int64, n)
+    costs = np.fromiter(map(int, snd_rt.values()), np.int64, n)
+    return dests, costs
 
 '''
 
     Command: def data_pckt():
-        Builds the routing update packet
+        Builds the routing update packet. With split horizon / poisoned reverse the packet is
+        built for one neighbor (to) - routes learned through it are left out (split) or
+        advertised as INF (poison). Incremental updates always poison, since a changed route
+        that is left out would never be withdrawn.
 
 '''
-def data_pckt(state, reason=None, link_update=None):
-    with state['lock']:
-        # take cost from routing table
-        rt_cost = {server_id: cost for server_id, (hop, cost) in state['rt'].items()}
+def data_pckt(state, reason=None, link_update=None, fmt='json', dests=None, seq=None,
+              resync=False, to=None, link_updates=None):
+    horizon = state.horizon if to is not None else 'none'
+    # read from the snapshot - route processing is not held up
+    rt = snapshot(state)
+    # take cost from routing table
+    if dests is None:
+        if horizon == 'split':
+            rt_cost = {server_id: cost for server_id, (hop, cost) in rt.items() if hop != to}
+        elif horizon == 'poison':
+            rt_cost = {server_id: (INF if hop == to else cost)
+                       for server_id, (hop, cost) in rt.items()}
+        else:
+            rt_cost = {server_id: cost for server_id, (hop, cost) in rt.items()}
+    # incremental update - changed destinations only
+    elif horizon != 'none':
+        rt_cost = {d: (INF if rt[d][0] == to else rt[d][1]) for d in dests if d in rt}
+    else:
+        rt_cost = {d: rt[d][1] for d in dests if d in rt}
+    # a sequenced packet without dests is a full table
+    full = seq is not None and dests is None
+    # full table that leaves out routes learned through the receiver - missing means withdrawn
+    split = horizon == 'split' and dests is None
+    # binary packet for neighbors that speak it
+    if fmt == 'bin':
+        return enc_bin(state.user, state.my_ip, state.my_port, rt_cost,
+                       reason=reason, link_update=link_update, seq=seq, full=full,
+                       resync=resync, link_updates=link_updates, split=split)
     # base information
     packet = {
-        'user' : state['user'],
-        'my_ip' : state['my_ip'],
-        'my_port' : state['my_port'],
+        'user' : state.user,
+        'my_ip' : state.my_ip,
+        'my_port' : state.my_port,
         'rt' : rt_cost
     }
+    # advertise binary support to json neighbors
+    if state.wire == 'bin':
+        packet['wire'] = 'bin'
     # add reason for update if provided
     if reason is not None:
         packet['reason'] = reason
+    # incremental update fields
+    if seq is not None:
+        packet['seq'] = seq
+        packet['full'] = full
+    if resync:
+        packet['resync'] = True
+    if split:
+        packet['split'] = True
 
     # add link update packet if provided
     if link_update is not None:
@@ -338,65 +1759,389 @@ def data_pckt(state, reason=None, link_update=None):
             'server2': server2,
             'cost': cost
         }
+    # bulk update - list of link updates
+    if link_updates:
+        packet['link_updates'] = [{'server1': s1, 'server2': s2, 'cost': c}
+                                  for s1, s2, c in link_updates]
     return json.dumps(packet).encode('utf-8')
 
+'''
+
+    Command: def enc_bin():
+        Packs a routing update into the binary wire format - fixed header, optional link update,
+        optional list of link updates, optional sequence number, then (dest, cost) pairs as
+        unsigned 32 bit ints in network byte order
+
+'''
+def enc_bin(user, my_ip, my_port, rt_cost, reason=None, link_update=None, seq=None,
+            full=False, resync=False, link_updates=None, split=False):
+    flags = 0
+    if link_update is not None:
+        flags |= F_LINK
+    if link_updates:
+        flags |= F_LINKS
+    if seq is not None:
+        flags |= F_SEQ
+    if full:
+        flags |= F_FULL
+    if resync:
+        flags |= F_RESYNC
+    if split:
+        flags |= F_SPLIT
+    # header
+    parts = [HDR.pack(WIRE_MAGIC, WIRE_VER, flags, REASONS.index(reason), int(user),
+                      socket.inet_aton(my_ip), int(my_port), len(rt_cost))]
+    # link update follows the header
+    if link_update is not None:
+        parts.append(pack_link(link_update))
+    # then the bulk update
+    if link_updates:
+        parts.append(LINK_N.pack(len(link_updates)))
+        parts.extend(pack_link(link) for link in link_updates)
+    # then the sequence number
+    if seq is not None:
+        parts.append(SEQ.pack(seq & 0xFFFFFFFF))
+    # interleaved dest, cost pairs
+    try:
+        pairs = array('I', [v for item in rt_cost.items() for v in item])
+    # a cost outside 0..INF - clamped, so every update can be encoded
+    except OverflowError:
+        pairs = array('I', [v for d, c in rt_cost.items() for v in (d, clamp_cost(c))])
+    if sys.byteorder == 'little':
+        pairs.byteswap()
+    parts.append(pairs.tobytes())
+    return b''.join(parts)
+
+# helper function - link update (server1, server2, cost) with the cost clamped to 0..INF
+def pack_link(link):
+    server1, server2, cost = link
+    return LINK.pack(int(server1), int(server2), clamp_cost(cost))
+
+# helper function - cost in the wire range 0..INF
+def clamp_cost(cost):
+    return max(0, min(int(cost), INF))
+
+'''
+
+    Command: def dec_bin():
+        Unpacks a binary routing update into the same dictionary layout as the json packet
+
+'''
+def dec_bin(data):
+    magic, ver, flags, code, user, ip, port, count = HDR.unpack_from(data)
+    # unknown version - drop like bad json
+    if ver != WIRE_VER or code >= len(REASONS):
+        raise ValueError(f"unsupported packet version {ver}")
+    off = HDR.size
+    packet = {
+        'user' : user,
+        'my_ip' : socket.inet_ntoa(ip),
+        'my_port' : port
+    }
+    if code:
+        packet['reason'] = REASONS[code]
+    # optional link update
+    if flags & F_LINK:
+        server1, server2, cost = LINK.unpack_from(data, off)
+        off += LINK.size
+        packet['link_update'] = {'server1': server1, 'server2': server2, 'cost': cost}
+    # optional list of link updates
+    if flags & F_LINKS:
+        links, = LINK_N.unpack_from(data, off)
+        off += LINK_N.size
+        packet['link_updates'] = [
+            dict(zip(('server1', 'server2', 'cost'), LINK.unpack_from(data, off + i * LINK.size)))
+            for i in range(links)]
+        off += links * LINK.size
+    # optional sequence number
+    if flags & F_SEQ:
+        packet['seq'], = SEQ.unpack_from(data, off)
+        off += SEQ.size
+        packet['full'] = bool(flags & F_FULL)
+    if flags & F_RESYNC:
+        packet['resync'] = True
+    if flags & F_SPLIT:
+        packet['split'] = True
+    # (dest, cost) pairs
+    pairs = array('I')
+    pairs.frombytes(data[off:off + 2 * count * pairs.itemsize])
+    if len(pairs) != 2 * count:
+        raise ValueError("truncated packet")
+    if sys.byteorder == 'little':
+        pairs.byteswap()
+    packet['rt'] = PairVec(pairs)
+    return packet
+
+'''
+
+    Command: def decode_pckt():
+        Detects the wire format of a datagram and decodes it
+    
+    Returns:
+        packet: dictionary with user, my_ip, my_port, rt and optional reason/link_update/
+                link_updates
+        fmt: 'bin' or 'json'
+
+'''
+def decode_pckt(data):
+    if data[:2] == WIRE_MAGIC:
+        return dec_bin(data), 'bin'
+    return json.loads(data.decode('utf-8')), 'json'
+
 '''
 
     Command: def snd_update():
         Sends routing updates to all neighbors, uses data_pckt to build packet and send it 
-        through UDP socket.
+        through UDP socket. Each wire format is only built once. With incremental updates
+        every neighbor gets its own packet - the destinations changed since the last update
+        it was sent, or the full table when asked for (full, resync request, first packet).
+        Split horizon / poisoned reverse also builds one packet per neighbor.
+        The lock is only held for the incremental update bookkeeping - packets are built
+        from the snapshot and sent by send_batch() without it.
 
 '''
-def snd_update(state, reason=None, link_update=None):
-    # build packet
-    pckt = data_pckt(state, reason=reason, link_update=link_update)
+def snd_update(state, reason=None, link_update=None, full=False, to=None, resync=False,
+               link_updates=None):
+    start = time.perf_counter()
+    plan = {}
+    servers, peer_fmt = state.servers, state.peer_fmt
+    # neighbor address and wire format (copy of the neighbor ids - no lock needed)
+    targets = [(n_id, servers[n_id], peer_fmt.get(n_id, 'json'))
+               for n_id in list(state.neighbors)
+               if n_id in servers and (to is None or n_id == to)]
+    # per neighbor sequence number and changed destinations
+    if state.delta:
+        tx_seq, need_full, dirty = state.tx_seq, state.need_full, state.dirty
+        with state.lock:
+            for n_id, _, _ in targets:
+                seq = tx_seq[n_id] = tx_seq.get(n_id, 0) + 1
+                if full or seq == 1 or n_id in need_full:
+                    need_full.discard(n_id)
+                    dests = None
+                else:
+                    dests = dirty.get(n_id, set())
+                dirty[n_id] = set()
+                plan[n_id] = (seq, dests)
+    # json only when binary is turned off locally
+    if state.wire != 'bin':
+        targets = [(n_id, addr, 'json') for n_id, addr, fmt in targets]
+    # build packet (split large updates into fragments)
+    if state.delta or state.horizon != 'none':
+        out = [(n_id, addr, frag_pckt(state, zip_pckt(state, data_pckt(
+                    state, reason=reason, link_update=link_update, link_updates=link_updates,
+                    fmt=fmt, dests=plan.get(n_id, (None, None))[1],
+                    seq=plan.get(n_id, (None, None))[0], resync=resync, to=n_id))))
+               for n_id, addr, fmt in targets]
+    else:
+        pckt = {fmt: frag_pckt(state, zip_pckt(state, data_pckt(
+                    state, reason=reason, link_update=link_update, link_updates=link_updates,
+                    fmt=fmt)))
+                for fmt in {fmt for _, _, fmt in targets}}
+        out = [(n_id, addr, pckt[fmt]) for n_id, addr, fmt in targets]
+
+    # send outside the lock
+    sent = send_batch(state, out)
+
+    m = state.metrics
+    tx_pkts, tx_bytes = m['tx_pkts'], m['tx_bytes']
+    with state.lock:
+        for n_id, pkts, nbytes, err in sent:
+            tx_pkts[n_id] = tx_pkts.get(n_id, 0) + pkts
+            tx_bytes[n_id] = tx_bytes.get(n_id, 0) + nbytes
+            # send error - counted, the next update tries again
+            if err is not None:
+                m['tx_err'][n_id] = m['tx_err'].get(n_id, 0) + 1
+                m['tx_err_last'][n_id] = repr(err)
+        # time spent in snd_update
+        took = time.perf_counter() - start
+        m['snd_calls'] += 1
+        m['snd_time'] += took
+        m['snd_max'] = max(m['snd_max'], took)
 
-    with state['lock']:
-    # go through each neighbor and send the packet
-        targets = [(n_id, state['servers'][n_id]) for n_id in state['neighbors'] if n_id in state['servers']]
-        for n_id, (ip, port) in targets:
-            try:
-                state['sock'].sendto(pckt,(ip, port))
-            # ignore send error (stops program from crashing)
-            except Exception:
-                pass
+'''
+
+    Command: def send_batch():
+        Sends the packets built by snd_update() to every neighbor. Large fan-outs are split
+        into SEND_BATCH neighbor jobs for the sender pool (--send-threads) - sendto releases
+        the GIL, so the system calls overlap. Smaller ones are sent from the calling thread.
+
+    Returns:
+        list of (neighbor, datagrams sent, bytes sent, error or None)
+
+'''
+def send_batch(state, out):
+    pool = state.send_pool
+    if pool is None or len(out) <= SEND_BATCH:
+        return send_to(state.sock, out)
+    jobs = [pool.submit(send_to, state.sock, out[i:i + SEND_BATCH])
+            for i in range(0, len(out), SEND_BATCH)]
+    return [res for job in jobs for res in job.result()]
+
+# helper function - sends each neighbor its datagrams, an error skips that neighbor's rest
+def send_to(sock, out):
+    sent = []
+    for n_id, addr, dgrams in out:
+        pkts = nbytes = 0
+        err = None
+        try:
+            for dgram in dgrams:
+                sock.sendto(dgram, addr)
+                pkts += 1
+                nbytes += len(dgram)
+        # send error (unreachable, buffer full) - reported to the caller
+        except Exception as e:
+            err = e
+        sent.append((n_id, pkts, nbytes, err))
+    return sent
 
-# helper function to invalidate routes through any neighbors
+# helper function to invalidate routes through any neighbors - they move to the best
+# other neighbor from the cached vectors, or INF
 def invalidate_routes(state, neighbor_id):
-    for dest_id in list(state['rt'].keys()):
-        hop, _ = state['rt'][dest_id]
-        if hop == neighbor_id:
-            state['rt'][dest_id] = (-1, INF)
+    # only the routes through the neighbor (next hop index)
+    reroute(state, list(state.via.get(neighbor_id, ())))
+
+# helper function after the link cost to a neighbor changed - recompute every destination
+# the neighbor advertised (cost went up or down)
+def link_changed(state, neighbor_id):
+    dests = set(state.nvec.get(neighbor_id, ()))
+    dests.add(neighbor_id)
+    reroute(state, dests)
+
+'''
+
+    Command: def reroute(): picks the best route to each destination from the direct links and
+                            the cached neighbor vectors (caller holds the lock). Keeps the
+                            current next hop on a tie.
+
+'''
+def reroute(state, dests):
+    # vectorized engine
+    if np is not None and isinstance(state.rt, ArrayRT):
+        return reroute_np(state, dests)
+    user, inf, rt, nvec = state.user, state.inf, state.rt, state.nvec
+    # usable links
+    links = [(n, c, nvec.get(n, {})) for n, c in state.neighbors.items() if c < inf]
+    for d in dests:
+        if d == user:
+            continue
+        cur_hop = rt.get(d, (-1, INF))[0]
+        best_hop, best = -1, INF
+        for n, c, vec in links:
+            # direct link, otherwise the neighbor's advertised cost
+            if n == d:
+                cand = c
+            else:
+                sndc = vec.get(d, INF)
+                cand = INF if sndc >= inf else c + sndc
+            if cand < best or (cand == best and n == cur_hop):
+                best_hop, best = n, cand
+        if best >= inf:
+            set_route(state, d, -1, INF)
+        else:
+            set_route(state, d, best_hop, best)
+
+
+# helper function - reroute() over ArrayRT indices, one vector pass per neighbor
+def reroute_np(state, dests):
+    rt, inf = state.rt, state.inf
+    ids = np.fromiter(dests, np.int64)
+    ids = ids[ids != state.user]
+    if not len(ids):
+        return
+    idx = rt.index(ids)
+    cur = rt.hop[idx]
+    best = np.full(len(idx), INF, dtype=np.int64)
+    best_hop = np.full(len(idx), -1, dtype=np.int64)
+    for n, c in state.neighbors.items():
+        if c >= inf:
+            continue
+        vec = state.nvec.get(n)
+        if isinstance(vec, NbrVec):
+            vec.fit()
+            sndc = vec.cost[idx]
+            cand = np.where(sndc >= inf, INF, c + sndc)
+        else:
+            cand = np.full(len(idx), INF, dtype=np.int64)
+        # direct link
+        cand[ids == n] = c
+        # keep the current next hop on a tie
+        take = (cand < best) | ((cand == best) & (cur == n))
+        best[take] = cand[take]
+        best_hop[take] = n
+    best_hop[best >= inf] = -1
+    best[best >= inf] = INF
+    changed = np.flatnonzero((best_hop != cur) | (best != rt.cost[idx]))
+    if len(changed):
+        set_routes(state, idx[changed], best_hop[changed], best[changed])
 
 '''
 
     Command: def dead_neigh():
         Detects and handles inactive neighbors, marks unreachable with INF and routes no longer valid for neighbors
-        that expected them
+        that expected them. Deadlines sit in a heap (state['dheap']) - only neighbors that are
+        due are looked at. A packet only moves state['deadline'] forward, the heap entry
+        catches up when it comes due, so healthy neighbors cost one heap push per timeout.
+
+    Returns:
+        time of the next deadline (state['clock']), None when no neighbor is armed
 
 '''
 def dead_neigh(state):
     # get current time
-    now = time.time()
-    # calculate max interval for inactivity
-    max_interval = state['interval'] * 3
-
-    with state['lock']:
-        # loop through neighbors and check last heard time
-        for neighbor_id in list(state['neighbors'].keys()):
-            # check last heard time for neighbor
-            last_time = state['last'].get(neighbor_id, 0)
-            # if last heard time is within max interval, continue
-            if now - last_time <= max_interval:
+    now = state.clock()
+    heap, deadline = state.dheap, state.deadline
+    # nothing due - no lock
+    if not heap or heap[0][0] > now:
+        return heap[0][0] if heap else None
+
+    with state.lock:
+        while heap and heap[0][0] <= now:
+            due, neighbor_id = heapq.heappop(heap)
+            cur = deadline.get(neighbor_id)
+            # disarmed
+            if cur is None:
+                continue
+            # heard from since - wait for the new deadline
+            if cur > due:
+                heapq.heappush(heap, (cur, neighbor_id))
                 continue
+            del deadline[neighbor_id]
             # if neighbor is already marked as INF, skip
-            if state['neighbors'][neighbor_id] >= INF:
+            if state.neighbors.get(neighbor_id, INF) >= INF:
                 continue
 
-            state['neighbors'][neighbor_id] = INF
-            state['rt'][neighbor_id] = (neighbor_id, INF)
+            state.neighbors[neighbor_id] = INF
+            set_route(state, neighbor_id, neighbor_id, INF)
             invalidate_routes(state, neighbor_id)
-                
+        return heap[0][0] if heap else None
+
+# helper function - (re)arms the dead neighbor deadline, rounded up to the detection
+# granularity so neighbors due together expire together (caller holds the lock)
+def arm_neigh(state, neighbor_id, now):
+    due = now + state.dead_mult * max(0.2, state.interval)
+    if state.dead_gran > 0:
+        due = math.ceil(due / state.dead_gran) * state.dead_gran
+    armed = neighbor_id in state.deadline
+    state.deadline[neighbor_id] = due
+    # first deadline (start, back from dead) - new heap entry, wake the timer if it is next
+    if not armed:
+        heapq.heappush(state.dheap, (due, neighbor_id))
+        if state.dheap[0][1] == neighbor_id:
+            state.wake.set()
+
+'''
+
+    Command: def liveness(): dead neighbor timer thread - sleeps until the next deadline
+
+'''
+def liveness(state):
+    while not state.stop.is_set():
+        nxt = dead_neigh(state)
+        # at most a second so stop is noticed
+        wait = 1.0 if nxt is None else min(1.0, max(0.0, nxt - state.clock()))
+        state.wake.wait(wait)
+        state.wake.clear()
+
 '''
 
     Command: def update():
@@ -408,10 +2153,10 @@ def update(state, server1, server2, cost):
     # server ids to int
     server1, server2 = int(server1), int(server2)
     # cost to int or INF
-    if isinstance(cost, str) and cost.lower() == 'inf':
-        cost = INF
-    else:
-        cost = int(cost)
+    cost = parse_cost(cost)
+    if cost is None:
+        print(f"Error: Cost must be 0 to {INF} or 'inf'.")
+        return
     # which server is neighbor
     if state['user'] == server1:
         neighbor = server2
@@ -425,10 +2170,127 @@ def update(state, server1, server2, cost):
         state['neighbors'][neighbor] = cost
         state['base_cost'][neighbor] = cost
         # update routing table for neighbor
-        state['rt'][neighbor] = (neighbor, cost)
+        set_route(state, neighbor, neighbor, cost)
+        # routes through the neighbor, from its cached vector
+        if cost >= INF:
+            invalidate_routes(state, neighbor)
+        else:
+            link_changed(state, neighbor)
     print("UPDATE SUCCESS")
-    # send update - cost change
-    snd_update(state, reason='update', link_update=(server1, server2, cost))
+    # send update - cost change, goes out with the next triggered update
+    queue_link(state, (server1, server2, cost))
+
+# helper function - cost argument of update/bulk to int ('inf' is INF), None when it is
+# not a number from 0 to INF
+def parse_cost(cost):
+    if isinstance(cost, str) and cost.lower() == 'inf':
+        return INF
+    cost = int(cost)
+    return cost if 0 <= cost <= INF else None
+
+'''
+
+    Command: def read_bulk():
+        Reads the link updates of a bulk command - one "<server1> <server2> <cost>" per line
+        from a file, or from stdin ('-') until an empty line. Blank lines and # comments are
+        skipped.
+
+    Returns:
+        the bulk command with the updates inline (bulk s1 s2 cost s1 s2 cost ...)
+
+'''
+def read_bulk(src):
+    lines = []
+    if src == '-':
+        print(BULK_PROMPT)
+        while True:
+            try:
+                line = input()
+            except EOFError:
+                break
+            if not line.strip():
+                break
+            lines.append(line)
+    else:
+        with open(src) as f:
+            lines = f.read().splitlines()
+    return bulk_cmd(lines)
+
+# helper function - read_bulk() for the asyncio mode, stdin and the file are read off the
+# loop thread so the other servers keep running
+async def read_bulk_async(loop, src):
+    if src != '-':
+        return await loop.run_in_executor(None, read_bulk, src)
+    print(BULK_PROMPT)
+    lines = []
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line.strip():
+            break
+        lines.append(line)
+    return bulk_cmd(lines)
+
+# helper function - bulk command from the update lines of read_bulk()
+def bulk_cmd(lines):
+    cmd = ['bulk']
+    for line in lines:
+        fields = line.split('#', 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) != 3:
+            raise ValueError(f"bad bulk update line: {line.strip()}")
+        cmd.extend(fields)
+    return cmd
+
+'''
+
+    Command: def bulk():
+        Changes the cost of many links at once (maintenance reweighting). All links are applied
+        under one lock, the affected destinations are recomputed in one reroute() and the
+        changes go to the neighbors together in the next triggered update (link_updates).
+
+'''
+def bulk(state, args):
+    links = []
+    for i in range(0, len(args), 3):
+        server1, server2, cost = int(args[i]), int(args[i + 1]), parse_cost(args[i + 2])
+        # cost to int or INF
+        if cost is None:
+            print(f"Error: {server1} {server2} - cost must be 0 to {INF} or 'inf'.")
+            continue
+        # which server is neighbor
+        if state['user'] == server1:
+            neighbor = server2
+        elif state['user'] == server2:
+            neighbor = server1
+        else:
+            print(f"Error: {server1} {server2} - one of the servers must be the user server.")
+            continue
+        if neighbor not in state['neighbors']:
+            print(f"Error: Server {neighbor} is not a neighbor.")
+            continue
+        links.append((server1, server2, cost, neighbor))
+    if not links:
+        return
+    with state['lock']:
+        # update neighbor costs
+        for server1, server2, cost, neighbor in links:
+            state['neighbors'][neighbor] = cost
+            state['base_cost'][neighbor] = cost
+            set_route(state, neighbor, neighbor, cost)
+        # destinations behind the changed links - routes through a disabled neighbor, the
+        # vector of the others
+        dests = set()
+        for server1, server2, cost, neighbor in links:
+            dests.add(neighbor)
+            if cost >= INF:
+                dests.update(state['via'].get(neighbor, ()))
+            else:
+                dests.update(state['nvec'].get(neighbor, ()))
+        reroute(state, dests)
+    print(f"BULK UPDATE SUCCESS: {len(links)} links")
+    # send update - all links in one triggered update
+    queue_link(state, *[(server1, server2, cost) for server1, server2, cost, _ in links])
 
 '''
 
@@ -448,12 +2310,151 @@ Command: def pckts():
 
 '''
 def pckts(state):
+    # read and reset together so no packet is lost in between
+    with state.lock:
+        pkts, state.pkts = state.pkts, 0
     # print number of packets received
-    print('Packets: ',state['pkts'])
-    # reset count 0
-    state['pkts'] = 0
+    print('Packets: ',pkts)
+    # large updates lost to missing fragments
+    if state.reasm_drops:
+        print('Reassembly drops: ',state.reasm_drops)
     print('Packets Secured.')
 
+'''
+
+    Command: def get_stats():
+        Collects the metrics into a json friendly dictionary - per neighbor packets/bytes,
+        decode failures, bell_ford calls, routes changed, snd_update and lock timing, route age.
+        routes=True adds the seconds since each route last changed.
+
+'''
+def get_stats(state, routes=False):
+    rt = snapshot(state)
+    lock = state['lock']
+    with lock:
+        m = state['metrics']
+        now = state['clock']()
+        when = dict(state['rt_when'])
+        last = state['last_change']
+        neigh = sorted(set(m['rx_pkts']) | set(m['tx_pkts']) | set(state['neighbors']))
+        stats = {
+            'user' : state['user'],
+            'uptime' : now - m['start'],
+            'neighbors' : {str(n): {
+                'cost' : state['neighbors'].get(n),
+                'rx_pkts' : m['rx_pkts'].get(n, 0),
+                'rx_bytes' : m['rx_bytes'].get(n, 0),
+                'tx_pkts' : m['tx_pkts'].get(n, 0),
+                'tx_bytes' : m['tx_bytes'].get(n, 0),
+                'tx_err' : m['tx_err'].get(n, 0),
+                'tx_err_last' : m['tx_err_last'].get(n)
+            } for n in neigh},
+            'decode_err' : m['decode_err'],
+            'shed_addr' : m['shed_addr'],
+            'shed_spoof' : m['shed_spoof'],
+            'shed_rate' : {str(n): c for n, c in m['shed_rate'].items()},
+            'damped' : m['damped'],
+            'suppressed' : sum(1 for pen, when in state['penalty'].values()
+                               if pen * 0.5 ** ((now - when) / state['damp_half']) > DAMP_SUPPRESS)
+                           if state['penalty'] else 0,
+            'reasm_drops' : state['reasm_drops'],
+            'bf_calls' : m['bf_calls'],
+            'routes' : len(rt),
+            'routes_changed' : m['routes_changed'],
+            'snd_calls' : m['snd_calls'],
+            'snd_avg_ms' : 1000 * m['snd_time'] / max(1, m['snd_calls']),
+            'snd_max_ms' : 1000 * m['snd_max'],
+            'zip' : {
+                'pkts' : m['zip_pkts'],
+                'skipped' : m['zip_skip'],
+                'bytes_in' : m['zip_in'],
+                'bytes_out' : m['zip_out'],
+                'ratio' : m['zip_in'] / m['zip_out'] if m['zip_out'] else 1.0,
+                'cpu_us' : 1e6 * m['zip_time'] / max(1, m['zip_pkts']),
+                'unzip_pkts' : m['unzip_pkts'],
+                'unzip_cpu_us' : 1e6 * m['unzip_time'] / max(1, m['unzip_pkts'])
+            }
+        }
+    # lock counters are only touched while holding the lock - read after release
+    stats['lock'] = {
+        'acquires' : lock.acquires,
+        'wait_avg_us' : 1e6 * lock.wait / max(1, lock.acquires),
+        'wait_max_us' : 1e6 * lock.wait_max,
+        'hold_avg_us' : 1e6 * lock.hold / max(1, lock.acquires),
+        'hold_max_us' : 1e6 * lock.hold_max
+    }
+    # seconds since the last / first route change
+    if when:
+        stats['last_change_s'] = now - last
+        stats['oldest_change_s'] = now - min(when.values())
+    if routes:
+        stats['route_age_s'] = {str(d): now - t for d, t in when.items()}
+    return stats
+
+'''
+
+    Command: def show_stats(): prints the metrics (stats command)
+
+'''
+def show_stats(state):
+    st = get_stats(state)
+    print(f"Uptime: {st['uptime']:.1f} s    Routes: {st['routes']}")
+    print("neighbor |  cost  |  rx pkts  |  rx bytes  |  tx pkts  |  tx bytes  | tx err")
+    for n, v in st['neighbors'].items():
+        c = "INF" if v['cost'] is None or v['cost'] >= INF else str(v['cost'])
+        print(f"{n:<9}|{c:^8}|{v['rx_pkts']:^11}|{v['rx_bytes']:^12}|{v['tx_pkts']:^11}"
+              f"|{v['tx_bytes']:^12}|{v['tx_err']:^8}")
+    print(f"Decode failures: {st['decode_err']}    Reassembly drops: {st['reasm_drops']}")
+    print(f"Shed: unknown address {st['shed_addr']}, wrong server id {st['shed_spoof']}, "
+          f"rate limited {sum(st['shed_rate'].values())}    Damped route changes: "
+          f"{st['damped']} ({st['suppressed']} routes suppressed)")
+    print(f"bell_ford calls: {st['bf_calls']}    Routes changed: {st['routes_changed']}")
+    print(f"snd_update: {st['snd_calls']} calls, avg {st['snd_avg_ms']:.3f} ms, "
+          f"max {st['snd_max_ms']:.3f} ms")
+    z = st['zip']
+    if z['pkts'] or z['unzip_pkts']:
+        print(f"compression: {z['pkts']} packets ({z['skipped']} not smaller), "
+              f"{z['bytes_in']} -> {z['bytes_out']} bytes, ratio {z['ratio']:.2f}, "
+              f"cpu {z['cpu_us']:.1f} us/packet    decompressed: {z['unzip_pkts']} packets, "
+              f"cpu {z['unzip_cpu_us']:.1f} us/packet")
+    lk = st['lock']
+    print(f"lock: {lk['acquires']} acquires, wait avg {lk['wait_avg_us']:.1f} us / max "
+          f"{lk['wait_max_us']:.1f} us, hold avg {lk['hold_avg_us']:.1f} us / max "
+          f"{lk['hold_max_us']:.1f} us")
+    if 'last_change_s' in st:
+        print(f"Last route change: {st['last_change_s']:.1f} s ago, oldest: "
+              f"{st['oldest_change_s']:.1f} s ago")
+
+'''
+
+    Command: def stats_srv():
+        Local UDP endpoint on 127.0.0.1 - any datagram gets the metrics back as json.
+        A request containing 'routes' also gets the age of each route (dropped again if
+        the reply would not fit in one datagram).
+
+        Usage Example:
+            echo routes | nc -u -w1 127.0.0.1 9000
+
+'''
+def stats_srv(state, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', port))
+    sock.settimeout(1.0)
+    while not state['stop'].is_set():
+        try:
+            req, addr = sock.recvfrom(RECV_BUF)
+            reply = json.dumps(get_stats(state, routes=b'routes' in req)).encode('utf-8')
+            if len(reply) > MAX_UDP:
+                stats = get_stats(state)
+                stats['route_age_s'] = 'too large'
+                reply = json.dumps(stats).encode('utf-8')
+            sock.sendto(reply, addr)
+        except socket.timeout:
+            continue
+        except OSError:
+            continue
+    sock.close()
+
 '''
 
     Command: def display():
@@ -461,27 +2462,29 @@ def pckts(state):
 
 '''
 def display(state):
-    # routing table not modified while print ('lock')
-    with state['lock']:
-        print("dest     |     cost     |     next hop")
-        
-        # go through each destination
-        for dest in sorted(state['rt'].keys()):
-            hop, cost = state['rt'][dest]
-            # format for cost (unreachable -> INF)
-            if cost >= INF:
-                c = "INF"
-            # int to string
-            else:
-                c = str(cost)
-            # format for hop (unreachable -> blank)
-            if hop == -1 or cost >= INF:
-                h = ''
-            # int to string
-            else:
-                h = str(hop)
-            
-            print(f"{dest:<9}|{c:^14}|{h:^14}")
+    # print from a snapshot - routing goes on while the terminal catches up
+    rt = snapshot(state)
+    print("dest     |     cost     |     next hop")
+
+    # go through each destination
+    for dest in sorted(rt.keys()):
+        hop, cost = rt[dest]
+        # format for cost (unreachable -> INF)
+        if cost >= INF:
+            c = "INF"
+        # int to string
+        else:
+            c = str(cost)
+        # format for hop (unreachable -> blank)
+        if hop == -1 or cost >= INF:
+            h = ''
+        # int to string - * when it comes from a checkpoint not confirmed yet
+        else:
+            h = str(hop) + ('*' if hop in state['stale'] else '')
+
+        print(f"{dest:<9}|{c:^14}|{h:^14}")
+    if state['stale']:
+        print("* warm start - not confirmed by the neighbor yet")
 
 '''
 
@@ -492,21 +2495,26 @@ def display(state):
 '''
 # helper function to recalculate routes after disabling a neighbor
 def recalculate_routes(state):
-    for server_id in state['servers']:
+    # routes with a next hop and the direct links - everything else is already (-1, INF)
+    dests = set(state.neighbors)
+    dests.add(state.user)
+    for hop_dests in state.via.values():
+        dests.update(hop_dests)
+    for server_id in dests:
         # 0 cost for user
-        if server_id == state['user']:
-            state['rt'][server_id] = (server_id, 0)
+        if server_id == state.user:
+            set_route(state, server_id, server_id, 0)
         # direct neighbor
-        elif server_id in state['neighbors']:
-            cost = state['neighbors'][server_id]
+        elif server_id in state.neighbors:
+            cost = state.neighbors[server_id]
             # unreachable (INF)
             if cost >= INF:
-                state['rt'][server_id] = (server_id, INF)
+                set_route(state, server_id, server_id, INF)
             else:
-                state['rt'][server_id] = (server_id, cost)
+                set_route(state, server_id, server_id, cost)
         # not a neighbor
         else:
-            state['rt'][server_id] = (-1, INF)
+            set_route(state, server_id, -1, INF)
 '''
 
     Command: def disable(): direct neighbor unreachable (INF), recalculates and informs servers 
@@ -525,15 +2533,13 @@ def disable(state, server_id):
         state['neighbors'][server_id] = INF
         state['base_cost'][server_id] = INF
 
-        state['rt'][server_id] = (server_id, INF)
+        set_route(state, server_id, server_id, INF)
         invalidate_routes(state, server_id)
         #recalculate_routes(state)
     print(f"SUCCESS: Link to neighbor {server_id} disabled.")
-    # send update to neighbors about the link cost change
-    snd_update(state, reason='update', link_update=(state['user'], server_id, INF))
-    time.sleep(0.2)  # Give time for the update to propagate
-    # send another update to ensure all neighbors are aware of the change
-    snd_update(state, reason='step')
+    # send update to neighbors about the link cost change - the triggered update
+    # also carries the invalidated routes
+    queue_link(state, (state['user'], server_id, INF))
 
 '''
 
@@ -547,7 +2553,7 @@ def crash(state):
         # go through all neighbors and mark as INF
         for s in list(state['neighbors'].keys()):
             state['neighbors'][s] = INF
-            state['rt'][s] = (s, INF)
+            set_route(state, s, s, INF)
     
     print('Bye!')
 
@@ -560,23 +2566,281 @@ def crash(state):
 def help():
     print("\nAvailable commands:")
     print(" update <server1> <server2> <cost> - Update the cost of a link between two servers")
+    print(" bulk <file> | bulk -              - Update many links at once (file or stdin)")
     print(" step                              - Send routing update")
     print(" pckts                             - Display the number of packets")
+    print(" stats                             - Display traffic, timing and route metrics")
     print(" display                           - Display the current routing table")
+    print(" verify <global topology>          - Check the routing table against shortest paths")
+    print(" profile start|stop|dump           - Sample the running threads, show hot functions")
     print(" disable <neighbor_id>             - Disable a link to a neighbor")
     print(" crash                             - Simulate a server crash")
+    print(" node <server_id>                  - Switch server (--mode async/proc with --ids)")
     print(" exit                              - Exit the program")
 
 '''
 
-    Command: def cmnds(): command loop for the server, reads input and outputs commands
+    Command: def banner(): startup message for a server
 
 '''
-def cmnds(state):
+def banner(state):
     print("\nStarted Vector Routing Server.")
     print(f"Server ID: {state['user']}")
     print(f"Listening on IP: {state['my_ip']}:{state['my_port']}")
     print("Type 'help' for a list of available commands.\n")  
+
+'''
+
+    Command: def verify():
+        Diffs the live routing table against the shortest paths of a global topology
+        (oracle.py) - wrong costs, next hops that are not on a shortest path, and how far the
+        table is from optimal. Link changes made with update/disable/bulk are not in the file.
+
+'''
+def verify(state, path):
+    import oracle
+    top = load_top(path)
+    if state['user'] not in top.servers:
+        print(f"Error: Server {state['user']} is not in {path}.")
+        return
+    rt = dict(snapshot(state).items())
+    start = time.perf_counter()
+    wrong = oracle.diff(top.servers, top.rows, state['user'], rt, state['inf'])
+    took = time.perf_counter() - start
+    # extra cost over the shortest paths (routes that are unreachable or too cheap aside)
+    gap = [live[1] - want[1] for _, live, want in wrong if want[1] <= live[1] < INF]
+    missing = sum(1 for _, live, want in wrong if live[1] >= INF > want[1])
+    print(f"Verified {len(top.servers) - 1} destinations against {path} in {took * 1000:.1f} ms")
+    if not wrong:
+        print("Routing table matches the shortest paths.")
+        return
+    print(f"Wrong routes: {len(wrong)} ({missing} unreachable, extra cost total {sum(gap)}, "
+          f"max {max(gap, default=0)})")
+    print("dest     |  live (hop, cost)  |  oracle (hop, cost)")
+    for dest, live, want in wrong[:VERIFY_SHOW]:
+        print(f"{dest:<9}|{str(live):^20}|{str(want):^21}")
+    if len(wrong) > VERIFY_SHOW:
+        print(f"... {len(wrong) - VERIFY_SHOW} more")
+
+'''
+
+    Class: Sampler
+        Sampling profiler of the running threads (profile command). A side thread reads the
+        stack of every other thread (sys._current_frames) hz times a second and counts each
+        distinct stack. Samples are wall-clock, so a thread blocked in recvfrom or waiting for
+        the lock shows up there - the cpu time of each thread tells busy from idle. Stacks are
+        written collapsed ("thread;outer;...;inner count" per line), the input of
+        flamegraph.pl, speedscope and similar tools.
+
+'''
+class Sampler:
+    def __init__(self, hz=PROFILE_HZ):
+        self.hz = hz
+        self.stacks = {}
+        self.cpu = {}
+        self.cpu0 = {}
+        self.elapsed = 0.0
+        self.since = 0.0
+        self.skip = set()
+        self.stop_ev = threading.Event()
+        self.thread = None
+
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        # the command thread waits in input() - left out, unless it runs the event loop
+        # (--mode async/proc), which also receives and sends
+        try:
+            asyncio.get_running_loop()
+            self.skip = set()
+        except RuntimeError:
+            self.skip = {threading.get_ident()}
+        self.stop_ev.clear()
+        self.cpu0 = self.cpu_times()
+        self.since = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_ev.set()
+        self.thread.join()
+        self.thread = None
+        self.elapsed += time.perf_counter() - self.since
+        for name, t in self.cpu_times().items():
+            if name in self.cpu0:
+                self.cpu[name] = self.cpu.get(name, 0.0) + t - self.cpu0[name]
+
+    # cpu seconds of each thread by name (Linux/Unix only)
+    def cpu_times(self):
+        times = {}
+        if not hasattr(time, 'pthread_getcpuclockid'):
+            return times
+        for t in threading.enumerate():
+            try:
+                times[t.name] = time.clock_gettime(time.pthread_getcpuclockid(t.ident))
+            except (OSError, TypeError):
+                pass
+        return times
+
+    def run(self):
+        skip = self.skip | {threading.get_ident()}
+        names = {}
+        stacks = self.stacks
+        while not self.stop_ev.wait(1.0 / self.hz):
+            for tid, frame in sys._current_frames().items():
+                if tid in skip:
+                    continue
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                 f"{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                key = ';'.join(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+
+    # collapsed stacks to a file
+    def dump(self, path):
+        stacks = dict(self.stacks)
+        with open(path, 'w') as f:
+            for key, count in sorted(stacks.items()):
+                f.write(f"{key} {count}\n")
+        return sum(stacks.values())
+
+    # samples per thread, and the functions with the most samples - self (running the
+    # function itself) and total (the function or anything it called)
+    def summary(self, top=PROFILE_TOP):
+        stacks = dict(self.stacks)
+        threads, own, total = {}, {}, {}
+        for key, count in stacks.items():
+            frames = key.split(';')
+            threads[frames[0]] = threads.get(frames[0], 0) + count
+            if len(frames) > 1:
+                own[frames[-1]] = own.get(frames[-1], 0) + count
+            for fn in set(frames[1:]):
+                total[fn] = total.get(fn, 0) + count
+        n = max(1, sum(threads.values()))
+        elapsed = self.elapsed + (time.perf_counter() - self.since if self.running() else 0.0)
+        print(f"Profile: {sum(threads.values())} samples over {elapsed:.1f} s at {self.hz} Hz")
+        for name, count in sorted(threads.items(), key=lambda kv: -kv[1]):
+            cpu = self.cpu.get(name)
+            print(f"  thread {name}: {count} samples"
+                  + (f", cpu {cpu:.3f} s" if cpu is not None else ""))
+        print(" self %  | total % | function")
+        for fn, count in sorted(own.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"{100 * count / n:^9.1f}|{100 * total[fn] / n:^9.1f}| {fn}")
+
+'''
+
+    Command: def profile():
+        profile start [hz] - samples the running threads (rx, tx, liveness, sender pool or the
+                             event loop) without a restart, 1 to PROFILE_HZ_MAX a second
+        profile stop       - stops sampling and prints the hot functions
+        profile dump [file] - writes the collapsed stacks (default profile_<id>.folded) and
+                             prints the hot functions, also while sampling
+
+'''
+def profile(state, args):
+    sampler = state['profiler']
+    action = args[0].lower() if args else ''
+    if action == 'start':
+        if sampler is not None and sampler.running():
+            print("Profiler already running.")
+            return
+        hz = int(args[1]) if len(args) > 1 else PROFILE_HZ
+        if not 0 < hz <= PROFILE_HZ_MAX:
+            print(f"Error: sampling rate must be 1 to {PROFILE_HZ_MAX} Hz.")
+            return
+        state['profiler'] = sampler = Sampler(hz)
+        sampler.start()
+        print(f"Profiling at {sampler.hz} Hz.")
+    elif sampler is None:
+        print("Error: Profiler not started.")
+    elif action == 'stop':
+        if sampler.running():
+            sampler.stop()
+        sampler.summary()
+    elif action == 'dump':
+        path = args[1] if len(args) > 1 else f"profile_{state['user']}.folded"
+        count = sampler.dump(path)
+        print(f"{count} samples written to {path}")
+        sampler.summary()
+    else:
+        print("Usage: profile start [hz] | stop | dump [file]")
+
+'''
+
+    Command: def run_cmd(): runs one command (split input line), returns False when the server stops
+
+'''
+def run_cmd(state, cmd):
+    # command keyword
+    command = cmd[0].lower()
+    # bulk update from a file or stdin - inline, so the capture has the updates
+    if command == 'bulk' and len(cmd) == 2:
+        cmd = read_bulk(cmd[1])
+    # route changing commands go into the capture for replay
+    if command in ('update', 'bulk', 'disable', 'crash'):
+        cap_write(state, CAP_CMD, ' '.join(cmd).encode('utf-8'))
+    if command == 'help':
+        help()
+    elif command == 'update' and len(cmd) == 4:
+        # update servers
+        update(state, cmd[1], cmd[2], cmd[3])
+    elif command == 'bulk' and len(cmd) > 1 and (len(cmd) - 1) % 3 == 0:
+        # update many links
+        bulk(state, cmd[1:])
+    elif command == 'step':
+        # routing update
+        step(state)
+    elif command == 'pckts':
+        # display packets
+        pckts(state)
+    elif command == 'stats':
+        # display metrics
+        show_stats(state)
+    elif command == 'display':
+        # display routing table
+        display(state)
+    elif command == 'verify' and len(cmd) == 2:
+        # compare with the oracle
+        verify(state, cmd[1])
+    elif command == 'profile':
+        # sampling profiler
+        profile(state, cmd[1:])
+    elif command == 'disable' and len(cmd) == 2:
+        # disable neighbor
+        disable(state, cmd[1])
+    elif command == 'crash':
+        # last checkpoint holds the neighbor vectors before the crash
+        save_checkpoint(state)
+        state['checkpoint'] = None
+        # stop server & exit (crash)
+        crash(state)
+        state['stop'].set()
+        return False
+    # clean exit not crash 
+    elif command == 'exit':
+        print("Exiting program...")
+        state['stop'].set()
+        return False
+    else:
+        # incorrect command input
+        print("Invalid command. Please try again.")
+        print("Type 'help' for a list of available commands.")
+    return True
+
+'''
+
+    Command: def cmnds(): command loop for the server, reads input and outputs commands
+
+'''
+def cmnds(state):
+    banner(state)
     
     while not state['stop'].is_set():
         try:
@@ -584,39 +2848,8 @@ def cmnds(state):
             cmd = input("> ").strip().split()
             if not cmd:
                 continue
-            # command keyword
-            command = cmd[0].lower()
-            if command == 'help':
-                help()
-            elif command == 'update' and len(cmd) == 4:
-                # update servers
-                update(state, cmd[1], cmd[2], cmd[3])
-            elif command == 'step':
-                # routing update
-                step(state)
-            elif command == 'pckts':
-                # display packets
-                pckts(state)
-            elif command == 'display':
-                # display routing table
-                display(state)
-            elif command == 'disable' and len(cmd) == 2:
-                # disable neighbor
-                disable(state, cmd[1])
-            elif command == 'crash':
-                # stop server & exit (crash)
-                crash(state)
-                state['stop'].set()
-                break
-            # clean exit not crash 
-            elif command == 'exit':
-                print("Exiting program...")
-                state['stop'].set()
+            if not run_cmd(state, cmd):
                 break
-            else:
-                # incorrect command input
-                print("Invalid command. Please try again.")
-                print("Type 'help' for a list of available commands.")
         except KeyboardInterrupt:
             print("\nExiting program...")
             state['stop'].set()
@@ -624,6 +2857,441 @@ def cmnds(state):
         except Exception as e:
             print(f"Error processing command: {e}")
 
+'''
+
+    Class: DVProtocol
+        asyncio datagram protocol - receives packets for one server on the event loop
+        (same handling as rx())
+
+'''
+class DVProtocol(asyncio.DatagramProtocol):
+    def __init__(self, state):
+        self.state = state
+
+    def datagram_received(self, data, addr):
+        if self.state['stop'].is_set():
+            return
+        try:
+            rx_dgram(self.state, data, addr)
+        # bad json or malformed binary packet
+        except (ValueError, struct.error):
+            pass
+        except Exception as e:
+            print(f"Error receiving packet: {e}")
+
+    # ICMP errors (port unreachable) - ignored like the connection reset in rx()
+    def error_received(self, exc):
+        pass
+
+'''
+
+    Class: LoopTrigger
+        Replaces the threading.Event in state['trigger'] in asyncio mode. set() arms a
+        hold-down timer on the loop (safe from any thread) that sends the triggered update.
+
+'''
+class LoopTrigger:
+    def __init__(self, loop, state):
+        self.loop = loop
+        self.state = state
+        self.flag = False
+        self.handle = None
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        if not self.flag:
+            self.flag = True
+            self.loop.call_soon_threadsafe(self.arm)
+
+    def clear(self):
+        self.flag = False
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    # hold-down - collect the rest of the burst
+    def arm(self):
+        if self.flag and self.handle is None and not self.state['stop'].is_set():
+            self.handle = self.loop.call_later(self.state['holddown'], self.fire)
+
+    def fire(self):
+        self.handle = None
+        self.flag = False
+        flush(self.state)
+
+'''
+
+    Class: LoopWake
+        Replaces the threading.Event in state['wake'] in asyncio mode - set() reschedules the
+        dead neighbor timer for an earlier deadline
+
+'''
+class LoopWake:
+    def __init__(self, loop, state):
+        self.loop = loop
+        self.state = state
+
+    def set(self):
+        self.loop.call_soon_threadsafe(watch, self.loop, self.state)
+
+'''
+
+    Command: def watch(): dead neighbor timer on the event loop - expires what is due and
+                          sleeps until the next deadline
+
+'''
+def watch(loop, state):
+    if state.get('dead_timer') is not None:
+        state.dead_timer.cancel()
+    if state.stop.is_set():
+        return
+    nxt = dead_neigh(state)
+    wait = 1.0 if nxt is None else max(0.0, nxt - state.clock())
+    state.dead_timer = loop.call_later(wait, watch, loop, state)
+
+'''
+
+    Command: def tick(): periodic update on the event loop, reschedules itself every interval
+
+'''
+def tick(loop, state):
+    if state.stop.is_set():
+        return
+    periodic(state)
+    # drop fragments that never completed
+    expire_frags(state)
+    # has 0.2 second minimum to prevent misinput from user commands
+    state.timer = loop.call_later(max(0.2, state.interval), tick, loop, state)
+
+'''
+
+    Command: def stop_node(): stops one server in asyncio mode - timers and socket
+
+'''
+def stop_node(state):
+    state['stop'].set()
+    state['trigger'].clear()
+    if state.get('timer') is not None:
+        state['timer'].cancel()
+    if state.get('dead_timer') is not None:
+        state['dead_timer'].cancel()
+    if state.get('transport') is not None:
+        state['transport'].close()
+
+'''
+
+    Command: def start_nodes(): asyncio mode - datagram endpoint, triggered update and dead
+                                neighbor timers for each server on the loop
+
+'''
+async def start_nodes(loop, states):
+    for st in states:
+        st['sock'].setblocking(False)
+        st['trigger'] = LoopTrigger(loop, st)
+        st['wake'] = LoopWake(loop, st)
+        st['transport'], _ = await loop.create_datagram_endpoint(
+            lambda st=st: DVProtocol(st), sock=st['sock'])
+        # first periodic update right away
+        tick(loop, st)
+        watch(loop, st)
+
+'''
+
+    Command: def serve(): asyncio mode - one datagram endpoint and timer per server, then the
+                          command reader. Commands go to the current server, 'node <id>'
+                          switches between hosted servers.
+
+'''
+async def serve(states):
+    loop = asyncio.get_running_loop()
+    await start_nodes(loop, states)
+
+    nodes = {st['user']: st for st in states}
+    cur = states[0]
+    banner(cur)
+    if len(states) > 1:
+        print(f"Hosting servers: {', '.join(str(i) for i in nodes)}\n")
+    while True:
+        print("> ", end='', flush=True)
+        # blocking read off the loop thread, command runs on the loop
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            print("\nExiting program...")
+            break
+        cmd = line.strip().split()
+        if not cmd:
+            continue
+        try:
+            # switch server
+            if cmd[0].lower() == 'node' and len(cmd) == 2:
+                if int(cmd[1]) in nodes and not nodes[int(cmd[1])]['stop'].is_set():
+                    cur = nodes[int(cmd[1])]
+                    print(f"Server ID: {cur['user']}")
+                else:
+                    print(f"Error: Server {cmd[1]} is not hosted here.")
+                continue
+            # bulk file / stdin - read without blocking the loop
+            if cmd[0].lower() == 'bulk' and len(cmd) == 2:
+                cmd = await read_bulk_async(loop, cmd[1])
+            if run_cmd(cur, cmd):
+                continue
+        except Exception as e:
+            print(f"Error processing command: {e}")
+            continue
+        # exit stops everything, crash only the current server
+        if cmd[0].lower() == 'exit':
+            break
+        stop_node(cur)
+        alive = [st for st in states if not st['stop'].is_set()]
+        if not alive:
+            break
+        cur = alive[0]
+        print(f"Server ID: {cur['user']}")
+    for st in states:
+        stop_node(st)
+
+'''
+
+    Command: def run_async(): runs the asyncio mode until exit and closes the sockets
+
+'''
+def run_async(states):
+    try:
+        asyncio.run(serve(states))
+    except KeyboardInterrupt:
+        print("\nExiting program...")
+    finally:
+        for st in states:
+            st['stop'].set()
+            save_checkpoint(st)
+            close_capture(st)
+            st['sock'].close()
+        print("Server stopped.")
+
+'''
+
+    Command: def worker(): one process of --mode proc - loads its shard of servers (only their
+                           link rows), serves them on its own event loop like --mode async and
+                           answers the supervisor over the pipe (conn)
+
+'''
+def worker(path, ids, interval, opts, conn):
+    try:
+        top = load_top(path, nodes=ids)
+        states = [state(top.servers, top.rows, interval, i, **opts) for i in ids]
+    except (TopologyError, OSError) as e:
+        conn.send(('error', str(e)))
+        return
+    try:
+        asyncio.run(shard(states, conn))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for st in states:
+            st['stop'].set()
+            save_checkpoint(st)
+            close_capture(st)
+            st['sock'].close()
+
+'''
+
+    Command: def shard(): event loop of a worker - supervisor requests come in over the pipe
+                          and run on the loop, printed output is sent back
+            ('cmd', id, cmd)  - one command on one server, replies (output, still running)
+            ('display',)      - routing table of every running server, replies (id, output)
+            ('stats',)        - get_stats() of every running server, replies list
+            ('exit',)         - stops every server
+
+'''
+async def shard(states, conn):
+    loop = asyncio.get_running_loop()
+    await start_nodes(loop, states)
+    nodes = {st['user']: st for st in states}
+    conn.send(('ready', sorted(nodes)))
+    while True:
+        try:
+            # blocking read off the loop thread
+            msg = await loop.run_in_executor(None, conn.recv)
+        # supervisor went away
+        except (EOFError, OSError):
+            break
+        if msg[0] == 'exit':
+            break
+        if msg[0] == 'cmd':
+            st = nodes[msg[1]]
+            alive = True
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                try:
+                    alive = run_cmd(st, msg[2])
+                except Exception as e:
+                    print(f"Error processing command: {e}")
+            if not alive:
+                stop_node(st)
+            conn.send((out.getvalue(), alive))
+        elif msg[0] == 'display':
+            tables = []
+            for srv_id, st in nodes.items():
+                if not st['stop'].is_set():
+                    out = io.StringIO()
+                    with contextlib.redirect_stdout(out):
+                        display(st)
+                    tables.append((srv_id, out.getvalue()))
+            conn.send(tables)
+        elif msg[0] == 'stats':
+            conn.send([get_stats(st) for st in nodes.values() if not st['stop'].is_set()])
+    for st in states:
+        stop_node(st)
+
+'''
+
+    Command: def run_procs():
+        --mode proc supervisor - splits the server ids round-robin into one shard per process,
+        starts the workers and runs the command loop. display and stats cover every server,
+        other commands go to the current server ('node <id>' switches).
+
+        Usage Example:
+            python3 dv.py -t <global topology> -i 2 --mode proc --ids all --procs 4
+
+'''
+def run_procs(path, ids, procs, interval, opts):
+    shards = [ids[k::procs] for k in range(max(1, procs))]
+    workers = []
+    for shard_ids in shards:
+        if not shard_ids:
+            continue
+        conn, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=worker, args=(path, shard_ids, interval, opts, child),
+                                       daemon=True)
+        proc.start()
+        workers.append((proc, conn, shard_ids))
+    # wait for every worker to bind its sockets
+    owner = {}
+    for proc, conn, shard_ids in workers:
+        try:
+            msg = conn.recv() if conn.poll(60) else ('error', 'no answer')
+        except EOFError:
+            msg = ('error', 'worker exited')
+        if msg[0] != 'ready':
+            print(f"Error: servers {','.join(map(str, shard_ids))}: {msg[1]}")
+            stop_procs(workers)
+            return
+        for srv_id in shard_ids:
+            owner[srv_id] = conn
+    print("\nStarted Vector Routing Servers.")
+    print(f"Hosting servers: {', '.join(map(str, ids))} in {len(workers)} processes")
+    print("Type 'help' for a list of available commands.\n")
+    cur = ids[0]
+    try:
+        while owner:
+            try:
+                cmd = input("> ").strip().split()
+            except EOFError:
+                print("\nExiting program...")
+                break
+            if not cmd:
+                continue
+            command = cmd[0].lower()
+            try:
+                if command == 'help':
+                    help()
+                elif command == 'exit':
+                    print("Exiting program...")
+                    break
+                # switch server
+                elif command == 'node' and len(cmd) == 2:
+                    if int(cmd[1]) in owner:
+                        cur = int(cmd[1])
+                        print(f"Server ID: {cur}")
+                    else:
+                        print(f"Error: Server {cmd[1]} is not hosted here.")
+                # every server
+                elif command == 'display':
+                    tables = []
+                    for conn in unique(owner.values()):
+                        conn.send(('display',))
+                        tables.extend(conn.recv())
+                    for srv_id, table in sorted(tables):
+                        print(f"\nServer {srv_id}:")
+                        print(table, end='')
+                elif command == 'stats':
+                    stats = []
+                    for conn in unique(owner.values()):
+                        conn.send(('stats',))
+                        stats.extend(conn.recv())
+                    show_all_stats(stats)
+                # current server (a bulk file / stdin is read here)
+                else:
+                    if command == 'bulk' and len(cmd) == 2:
+                        cmd = read_bulk(cmd[1])
+                    owner[cur].send(('cmd', cur, cmd))
+                    out, alive = owner[cur].recv()
+                    print(out, end='')
+                    if not alive:
+                        del owner[cur]
+                        if owner:
+                            cur = min(owner)
+                            print(f"Server ID: {cur}")
+            # worker died
+            except (EOFError, OSError) as e:
+                print(f"Error: worker for server {cur} is gone ({e})")
+                owner = {i: c for i, c in owner.items() if c is not owner[cur]}
+                if owner:
+                    cur = min(owner)
+            except Exception as e:
+                print(f"Error processing command: {e}")
+    except KeyboardInterrupt:
+        print("\nExiting program...")
+    finally:
+        stop_procs(workers)
+        print("Servers stopped.")
+
+# helper function - each pipe once, in order
+def unique(conns):
+    return list({id(c): c for c in conns}.values())
+
+# helper function - asks every worker to exit, terminates the ones that do not
+def stop_procs(workers):
+    for proc, conn, _ in workers:
+        try:
+            conn.send(('exit',))
+        except (OSError, ValueError):
+            pass
+    for proc, conn, _ in workers:
+        proc.join(timeout=2.0)
+        if proc.is_alive():
+            proc.terminate()
+        conn.close()
+
+'''
+
+    Command: def show_all_stats(): one line per server from get_stats() and the totals
+                                   (stats in --mode proc)
+
+'''
+def show_all_stats(stats):
+    print("server   | routes |  rx pkts  |  tx pkts  | tx err | decode err | bf calls | snd avg ms")
+    total = {'routes': 0, 'rx': 0, 'tx': 0, 'tx_err': 0, 'decode_err': 0, 'bf_calls': 0}
+    for st in sorted(stats, key=lambda st: st['user']):
+        rx = sum(v['rx_pkts'] for v in st['neighbors'].values())
+        tx = sum(v['tx_pkts'] for v in st['neighbors'].values())
+        tx_err = sum(v['tx_err'] for v in st['neighbors'].values())
+        print(f"{st['user']:<9}|{st['routes']:^8}|{rx:^11}|{tx:^11}|{tx_err:^8}|"
+              f"{st['decode_err']:^12}|{st['bf_calls']:^10}|{st['snd_avg_ms']:^11.3f}")
+        for k, v in (('routes', st['routes']), ('rx', rx), ('tx', tx), ('tx_err', tx_err),
+                     ('decode_err', st['decode_err']), ('bf_calls', st['bf_calls'])):
+            total[k] += v
+    print(f"{'total':<9}|{total['routes']:^8}|{total['rx']:^11}|{total['tx']:^11}|"
+          f"{total['tx_err']:^8}|{total['decode_err']:^12}|{total['bf_calls']:^10}|")
+    # compression over every server
+    zin = sum(st['zip']['bytes_in'] for st in stats)
+    zout = sum(st['zip']['bytes_out'] for st in stats)
+    if zout:
+        print(f"compression: {sum(st['zip']['pkts'] for st in stats)} packets, "
+              f"{zin} -> {zout} bytes, ratio {zin / zout:.2f}")
+
 '''
 
     Main: def main(): loads topology, creates server state, starts the threads, runs command loop and shuts 
@@ -634,15 +3302,71 @@ def cmnds(state):
 '''
 def main():
     args = p_args()
-    servers, l, first_server_id = read_top(args.topology)
-    st = state(servers, l, args.interval, first_server_id)
+    # --ids all - every server in the topology
+    every = args.ids == 'all'
+    ids = [int(i) for i in args.ids.split(',')] if args.ids and not every else []
+    # stats of proc workers only through the stats command
+    if args.stats_port and args.mode == 'proc':
+        print("Error: --stats-port is not supported with --mode proc, use the stats command.")
+        return
+    # only this process's link rows (every row for --ids all)
+    try:
+        top = load_top(args.topology, nodes=ids, own=not (ids or every))
+    except TopologyError as e:
+        print(f"Error: {e}")
+        return
+    servers, l = top.servers, top.rows
+    first_server_id = top.first
+    if every:
+        ids = list(servers)
+    for i in ids:
+        if i not in servers:
+            print(f"Error: Server {i} is not in the topology.")
+            return
+    opts = dict(wire=args.format, mtu=args.mtu, delta=args.delta, full_every=args.full_every,
+                holddown=args.holddown, horizon=args.horizon, infinity=args.infinity,
+                engine=args.engine, send_threads=args.send_threads,
+                dead_mult=args.dead_mult, dead_gran=args.dead_gran,
+                src_check=not args.no_src_check, rx_rate=args.rx_rate, rx_burst=args.rx_burst,
+                damp_half=args.damp_half, checkpoint_every=args.checkpoint_every,
+                seed=args.seed, compress=args.compress, compress_min=args.compress_min)
+    # one capture / checkpoint file per hosted server
+    for name in ('capture', 'checkpoint'):
+        path = getattr(args, name)
+        if path and len(ids) > 1 and '{id}' not in path:
+            path += '.{id}'
+        opts[name] = path
+    # worker processes - each loads its own rows
+    if args.mode == 'proc':
+        run_procs(args.topology, ids or [first_server_id], args.procs, args.interval, opts)
+        return
+    # asyncio event loop
+    if args.mode == 'async':
+        ids = ids or [first_server_id]
+        sts = [state(servers, l, args.interval, i, **opts) for i in ids]
+        if args.stats_port:
+            for k, st in enumerate(sts):
+                threading.Thread(target=stats_srv, args=(st, args.stats_port + k),
+                                 daemon=True).start()
+        run_async(sts)
+        return
+    if args.ids:
+        print("Error: --ids needs --mode async or proc.")
+        return
+    st = state(servers, l, args.interval, first_server_id, **opts)
 
-    rcv_thread = threading.Thread(target=rx, args=(st,), daemon=True)
+    if args.stats_port:
+        threading.Thread(target=stats_srv, args=(st, args.stats_port), daemon=True).start()
+
+    rcv_thread = threading.Thread(target=rx, args=(st,), name='rx', daemon=True)
     rcv_thread.start()
 
-    tsm_thread = threading.Thread(target=tx, args=(st,), daemon=True)
+    tsm_thread = threading.Thread(target=tx, args=(st,), name='tx', daemon=True)
     tsm_thread.start()
 
+    live_thread = threading.Thread(target=liveness, args=(st,), name='liveness', daemon=True)
+    live_thread.start()
+
     time.sleep(1)  # Give threads time to start
 
     try:
@@ -652,7 +3376,10 @@ def main():
 
         rcv_thread.join(timeout=1.0)
         tsm_thread.join(timeout=1.0)
+        live_thread.join(timeout=1.0)
 
+        save_checkpoint(st)
+        close_capture(st)
         st['sock'].close()
         print("Server stopped.")
 
@@ -0,0 +1,245 @@
+'''
+
+    Shortest-path oracle for the distance vector server (dv.py)
+        Description:
+        Computes the routes the distributed Bellman-Ford should converge to, centrally, from a
+        global topology (every server and every link, as read by dv.read_top()/load_top()).
+        Routes are (next hop, cost) like the server's routing table, unreachable is (-1, INF).
+            - single source: Dijkstra with a binary heap
+            - all pairs: Dijkstra per source, or vectorized Floyd-Warshall (NumPy) for dense
+              graphs
+            - diff() of a live routing table against the oracle (dv.py verify command)
+            - vectors() of a server's neighbors for seeding its table (dv.py --seed)
+
+        Usage Example:
+            python3 oracle.py -t <global topology> -s 1
+            python3 oracle.py -t <global topology> --all --method floyd
+            python3 dv.py -t <filename> -i 2 --seed <global topology>
+
+'''
+import argparse
+import heapq
+import time
+# optional - vectorized Floyd-Warshall
+try:
+    import numpy as np
+except ImportError:
+    np = None
+# constant - infinite cost (same as dv.INF)
+INF = 1000000000
+# auto method - Floyd-Warshall up to this many servers (n x n matrices) when the graph is
+# at least this dense (links / possible links)
+FW_MAX = 2000
+FW_DENSITY = 0.1
+
+'''
+
+    Command: def graph(): adjacency of the topology links - {server: {neighbor: cost}}, links at
+                          or above inf are left out, the cheaper of duplicate links is kept
+
+'''
+def graph(servers, rc, inf=INF):
+    adj = {srv_id: {} for srv_id in servers}
+    for s1, s2, c in rc:
+        s1, s2 = int(s1), int(s2)
+        cost = INF if c.lower() == 'inf' else int(c)
+        if cost >= inf:
+            continue
+        if cost < adj[s1].get(s2, INF):
+            adj[s1][s2] = cost
+            adj[s2][s1] = cost
+    return adj
+
+'''
+
+    Command: def dijkstra():
+        Single source shortest paths with a binary heap. The next hop of a destination is the
+        first server after src on its path. Paths at or above inf count as unreachable.
+
+    Returns:
+        dictionary of reachable dest : (next hop, cost), src itself is (src, 0)
+
+'''
+def dijkstra(adj, src, inf=INF):
+    dist = {src: 0}
+    hop = {src: src}
+    heap = [(0, src)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        # stale heap entry
+        if d > dist[u]:
+            continue
+        for v, c in adj[u].items():
+            nd = d + c
+            if nd >= inf or nd >= dist.get(v, INF):
+                continue
+            dist[v] = nd
+            hop[v] = v if u == src else hop[u]
+            heapq.heappush(heap, (nd, v))
+    return {dest: (hop[dest], dist[dest]) for dest in dist}
+
+'''
+
+    Command: def floyd():
+        All pairs shortest paths with Floyd-Warshall, one vectorized n x n relaxation per
+        intermediate server. Needs NumPy.
+
+    Returns:
+        ids: server ids (row/column order)
+        dist: n x n costs, INF when unreachable
+        hop: n x n next hop ids, -1 when unreachable
+
+'''
+def floyd(servers, rc, inf=INF):
+    ids = sorted(servers)
+    pos = {srv_id: i for i, srv_id in enumerate(ids)}
+    n = len(ids)
+    dist = np.full((n, n), INF, dtype=np.int64)
+    for u, links in graph(servers, rc, inf).items():
+        for v, c in links.items():
+            dist[pos[u], pos[v]] = c
+    np.fill_diagonal(dist, 0)
+    # next hop as an index - the destination itself over a direct link
+    nxt = np.where(dist < INF, np.arange(n)[None, :], -1)
+    for k in range(n):
+        alt = dist[:, k:k + 1] + dist[k:k + 1, :]
+        better = alt < dist
+        dist = np.where(better, alt, dist)
+        nxt = np.where(better, nxt[:, k:k + 1], nxt)
+    unreach = dist >= inf
+    dist[unreach] = INF
+    hop = np.asarray(ids, dtype=np.int64)[nxt]
+    hop[unreach] = -1
+    return ids, dist, hop
+
+'''
+
+    Command: def all_pairs():
+        Routes from every server - method 'dijkstra', 'floyd' or 'auto' (Floyd-Warshall for
+        small dense graphs when NumPy is installed, Dijkstra per source otherwise)
+
+    Returns:
+        dictionary of src : {reachable dest : (next hop, cost)}
+
+'''
+def all_pairs(servers, rc, inf=INF, method='auto'):
+    n = len(servers)
+    if method == 'auto':
+        dense = n > 1 and len(rc) >= FW_DENSITY * n * (n - 1) / 2
+        method = 'floyd' if np is not None and n <= FW_MAX and dense else 'dijkstra'
+    if method == 'floyd':
+        ids, dist, hop = floyd(servers, rc, inf)
+        res = {}
+        for i, src in enumerate(ids):
+            reach = np.flatnonzero(dist[i] < INF).tolist()
+            res[src] = {ids[j]: (int(hop[i, j]), int(dist[i, j])) for j in reach}
+        return res
+    adj = graph(servers, rc, inf)
+    return {src: dijkstra(adj, src, inf) for src in servers}
+
+'''
+
+    Command: def routes(): routing table of one server as the oracle sees it - every server,
+                           unreachable ones as (-1, INF)
+
+'''
+def routes(servers, rc, src, inf=INF):
+    best = dijkstra(graph(servers, rc, inf), src, inf)
+    return {dest: best.get(dest, (-1, INF)) for dest in servers}
+
+'''
+
+    Command: def vectors():
+        Distance vectors the neighbors of src would advertise once converged - used to seed
+        a server's table at startup (dv.py --seed)
+
+    Returns:
+        dictionary of neighbor : {reachable dest : cost}
+
+'''
+def vectors(servers, rc, src, inf=INF):
+    adj = graph(servers, rc, inf)
+    return {n: {dest: cost for dest, (hop, cost) in dijkstra(adj, n, inf).items()}
+            for n in adj[src]}
+
+'''
+
+    Command: def diff():
+        Compares a live routing table (dest : (next hop, cost)) of server src with the oracle.
+        A route is wrong when its cost is not the shortest one, or when the cost is right but
+        the next hop is not on any shortest path (equal cost paths are all fine). Destinations
+        missing from the table count as unreachable.
+
+    Returns:
+        list of (dest, live route, oracle route) for the wrong routes, by dest
+
+'''
+def diff(servers, rc, src, rt, inf=INF):
+    adj = graph(servers, rc, inf)
+    best = dijkstra(adj, src, inf)
+    # routes from the next hops, computed when needed
+    from_hop = {}
+    wrong = []
+    for dest in sorted(set(servers) | set(rt)):
+        if dest == src:
+            continue
+        hop, cost = rt.get(dest, (-1, INF))
+        if cost >= inf:
+            hop, cost = -1, INF
+        want = best.get(dest, (-1, INF))
+        if cost != want[1]:
+            wrong.append((dest, (hop, cost), want))
+            continue
+        if hop == want[0] or cost >= INF:
+            continue
+        # equal cost path through another neighbor
+        if hop not in adj[src]:
+            wrong.append((dest, (hop, cost), want))
+            continue
+        if hop not in from_hop:
+            from_hop[hop] = dijkstra(adj, hop, inf)
+        if adj[src][hop] + from_hop[hop].get(dest, (-1, INF))[1] != cost:
+            wrong.append((dest, (hop, cost), want))
+    return wrong
+
+'''
+
+    Command: def p_args(): handles the command line - topology, source server and method
+
+'''
+def p_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-t','--topology', required=True)
+    ap.add_argument('-s','--source', type=int)
+    ap.add_argument('--all', action='store_true')
+    ap.add_argument('--method', choices=('auto','dijkstra','floyd'), default='auto')
+    ap.add_argument('--infinity', type=int, default=INF)
+    return ap.parse_args()
+
+def main():
+    import dv
+    args = p_args()
+    try:
+        servers, rc, first = dv.read_top(args.topology)
+    except dv.TopologyError as e:
+        print(f"Error: {e}")
+        return
+    wall = time.perf_counter()
+    if args.all:
+        res = all_pairs(servers, rc, args.infinity, args.method)
+        took = time.perf_counter() - wall
+        pairs = sum(len(table) for table in res.values())
+        print(f"{len(servers)} servers, {len(rc)} links: {pairs} reachable pairs "
+              f"in {took:.3f} s ({args.method})")
+        return
+    src = first if args.source is None else args.source
+    table = routes(servers, rc, src, args.infinity)
+    took = time.perf_counter() - wall
+    print(f"Server {src}: {len(servers)} servers, {len(rc)} links in {took:.3f} s\n")
+    print("dest     |     cost     |     next hop")
+    for dest, (hop, cost) in sorted(table.items()):
+        print(f"{dest:<9}|{'inf' if cost >= INF else cost:^14}|"
+              f"{'none' if hop == -1 else hop:^14}")
+
+if __name__ == "__main__":
+    main()
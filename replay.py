@@ -0,0 +1,141 @@
+'''
+
+    Replay of a capture file written by dv.py --capture
+        Description:
+        Rebuilds the captured server from the topology and the options stored in the
+        capture, then feeds every recorded datagram through the same receive path as rx()
+        (rx_dgram - reassembly, decoding, update_neighbor_status, bell_ford) and re-runs the
+        recorded update/disable/crash commands, after the warm start (checkpoint, --seed)
+        the server began with. Time is the recorded clock, so dead neighbor and reassembly
+        timeouts fire between the same packets as in the live run. Nothing is sent.
+            - as fast as possible (default) or at the original pace (--pace)
+            - reports datagrams and bytes per second
+            - compares the final routing table with the one recorded when the server stopped
+
+        Usage Example:
+            python3 dv.py -t <filename> -i 2 --capture cap_{id}.log
+            python3 replay.py -t <filename> cap_1.log
+            python3 replay.py -t <filename> cap_1.log --pace
+
+'''
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import dv
+
+'''
+
+    Class: NullSock
+        Stands in for the server's UDP socket - replay only rebuilds the routing table
+
+'''
+class NullSock:
+    def sendto(self, data, addr):
+        pass
+
+    def close(self):
+        pass
+
+'''
+
+    Command: def replay(): runs the capture through a fresh server state
+
+    Returns:
+        dictionary with counts, elapsed time, rates and the table comparison
+
+'''
+def replay(path, topology, pace=False):
+    header, records = dv.read_capture(path)
+    user = header['user']
+    top = dv.load_top(topology, nodes=[user])
+    # recorded clock
+    now = [header['start']]
+    st = dv.state(top.servers, top.rows, header['interval'], user, sock=NullSock(),
+                  clock=lambda: now[0], **header['opts'])
+    # same warm start as the live run (checkpoint, --seed)
+    warm = header.get('warm')
+    if warm:
+        dv.warm_start(st, {int(n): c for n, c in warm['base_cost'].items()},
+                      {int(n): {d: c for d, c in vec} for n, vec in warm['nvec'].items()})
+    pkts = nbytes = cmds = bad = 0
+    final = None
+    wall = time.perf_counter()
+    for kind, when, addr, data in records:
+        # original pace - wait until the record's offset from the start
+        if pace:
+            delay = (when - header['start']) - (time.perf_counter() - wall)
+            if delay > 0:
+                time.sleep(delay)
+        now[0] = when
+        # dead neighbors and incomplete reassemblies that expired before this record
+        dv.dead_neigh(st)
+        dv.expire_frags(st)
+        if kind == dv.CAP_PKT:
+            pkts += 1
+            nbytes += len(data)
+            try:
+                dv.rx_dgram(st, data, addr)
+            except (ValueError, dv.struct.error):
+                bad += 1
+        elif kind == dv.CAP_CMD:
+            cmds += 1
+            with contextlib.redirect_stdout(io.StringIO()):
+                dv.run_cmd(st, data.decode('utf-8').split())
+        elif kind == dv.CAP_RT:
+            final = {int(d): tuple(v) for d, v in json.loads(data).items()}
+    took = time.perf_counter() - wall
+    rt = dict(dv.snapshot(st).items())
+    res = {
+        'user' : user,
+        'datagrams' : pkts,
+        'bytes' : nbytes,
+        'commands' : cmds,
+        'bad' : bad,
+        'time' : took,
+        'pkts_per_s' : pkts / took if took else 0.0,
+        'mb_per_s' : nbytes / took / 1e6 if took else 0.0,
+        'recorded' : final is not None,
+        'diff' : {} if final is None else
+                 {d: (rt.get(d), final.get(d)) for d in set(rt) | set(final)
+                  if rt.get(d) != final.get(d)}
+    }
+    return res
+
+'''
+
+    Command: def p_args(): handles the command line - topology, capture file and pace
+
+'''
+def p_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-t','--topology', required=True)
+    ap.add_argument('capture')
+    ap.add_argument('--pace', action='store_true')
+    return ap.parse_args()
+
+def main():
+    args = p_args()
+    try:
+        res = replay(args.capture, args.topology, pace=args.pace)
+    except dv.TopologyError as e:
+        print(f"Error: {e}")
+        return
+    print(f"Server {res['user']}: {res['datagrams']} datagrams, {res['bytes']} bytes, "
+          f"{res['commands']} commands, {res['bad']} undecodable")
+    print(f"{res['time']:.3f} s - {res['pkts_per_s']:.0f} datagrams/s, "
+          f"{res['mb_per_s']:.2f} MB/s")
+    if not res['recorded']:
+        print("No final routing table in the capture (server did not stop cleanly).")
+    elif not res['diff']:
+        print("Final routing table matches the live run.")
+    else:
+        print("Final routing table differs from the live run:")
+        print("dest     |  replay (hop, cost)  |  live (hop, cost)")
+        for d, (got, want) in sorted(res['diff'].items()):
+            print(f"{d:<9}|{str(got):^22}|{str(want):^20}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+'''
+
+    In-process simulator for the distance vector server (dv.py)
+        Description:
+        Loads one global topology (every server and every link) and creates a dv.py server
+        state for each server in a single process. Packets travel through an in-memory network
+        instead of UDP and time is virtual, so thousands of servers run in one process.
+        Every server runs the real dv.py code - handle_pckt/bell_ford, snd_update/data_pckt,
+        periodic/dead_neigh and the update/crash commands.
+            - reports convergence time (virtual seconds), messages and bytes per phase
+            - optional event after the first convergence: link cost change or server crash
+            - optional check of every routing table against the shortest paths (oracle.py)
+
+        Usage Example:
+            python3 sim.py -t <global topology> -i 1
+            python3 sim.py -t <global topology> -i 1 --update 1 2 20
+            python3 sim.py -t <global topology> -i 1 --crash 3 -d --horizon poison
+            python3 sim.py -t <global topology> -i 1 -m 400 --rx-rate 3 --check
+
+'''
+import argparse
+import time
+from collections import deque
+
+import dv
+import oracle
+
+'''
+
+    Class: MemSock
+        Stands in for a server's UDP socket - sendto() queues the datagram on the
+        in-memory network and counts it
+
+'''
+class MemSock:
+    def __init__(self, net, user, addr):
+        self.net = net
+        self.user = user
+        self.addr = addr
+
+    def sendto(self, data, addr):
+        net = self.net
+        if self.user in net['down']:
+            return
+        net['queue'].append((net['addr'][addr], data, self.addr))
+        net['msgs'] += 1
+        net['bytes'] += len(data)
+
+    def close(self):
+        pass
+
+'''
+
+    Class: SimTrigger
+        Stands in for state['trigger'] - the simulator sends triggered updates after each
+        hold-down step and uses set() to record when a route last changed (damped changes
+        do not trigger - phase() also reads state['last_change'])
+
+'''
+class SimTrigger:
+    def __init__(self, net):
+        self.net = net
+        self.flag = False
+
+    def is_set(self):
+        return self.flag
+
+    def set(self):
+        self.flag = True
+        self.net['last_change'] = self.net['now']
+        self.net['msgs_at_change'] = self.net['msgs']
+        self.net['bytes_at_change'] = self.net['bytes']
+
+    def clear(self):
+        self.flag = False
+
+'''
+
+    Command: def mk_net(): creates a server state per server in the topology, all attached to
+                           one in-memory network with a virtual clock
+
+'''
+def mk_net(servers, rc, interval, **opts):
+    net = {
+        'now' : 0.0,
+        'queue' : deque(),
+        'nodes' : {},
+        'addr' : {addr: srv_id for srv_id, addr in servers.items()},
+        'down' : set(),
+        'next' : {},
+        'msgs' : 0,
+        'bytes' : 0,
+        'last_change' : 0.0,
+        'msgs_at_change' : 0,
+        'bytes_at_change' : 0,
+        'servers' : servers,
+        'rc' : [tuple(row) for row in rc],
+        'interval' : max(0.2, interval),
+        'dead_mult' : opts.get('dead_mult', 3),
+        'step' : max(0.05, opts.get('holddown', 0.2))
+    }
+    # links of each server - state() only needs its own rows
+    rows = {srv_id: [] for srv_id in servers}
+    for row in rc:
+        rows[int(row[0])].append(row)
+        rows[int(row[1])].append(row)
+    clock = lambda: net['now']
+    for srv_id in servers:
+        st = dv.state(servers, rows[srv_id], interval, srv_id,
+                      sock=MemSock(net, srv_id, servers[srv_id]), clock=clock, **opts)
+        st['trigger'] = SimTrigger(net)
+        net['nodes'][srv_id] = st
+        # everybody sends the first periodic update at time 0
+        net['next'][srv_id] = 0.0
+    return net
+
+'''
+
+    Command: def step(): advances the network one hold-down step - delivers queued packets,
+                         expires dead neighbors, sends triggered updates, then periodic
+                         updates that are due
+
+'''
+def step(net):
+    nodes, queue, down = net['nodes'], net['queue'], net['down']
+    # deliver (zero latency - packets sent while handling are delivered too)
+    while queue:
+        dst, data, src = queue.popleft()
+        if dst in down:
+            continue
+        try:
+            dv.rx_dgram(nodes[dst], data, src)
+        except (ValueError, dv.struct.error):
+            pass
+    net['now'] += net['step']
+    # dead neighbor deadlines and reassembly deadlines that came due
+    for srv_id, st in nodes.items():
+        if srv_id not in down:
+            dv.dead_neigh(st)
+            dv.expire_frags(st)
+    # triggered updates
+    for srv_id, st in nodes.items():
+        if st.trigger.flag and srv_id not in down:
+            st.trigger.clear()
+            dv.flush(st)
+    # periodic updates
+    for srv_id, due in net['next'].items():
+        if due <= net['now'] and srv_id not in down:
+            dv.periodic(nodes[srv_id])
+            net['next'][srv_id] = due + net['interval']
+
+'''
+
+    Command: def wrong_routes(): routes of the running servers that are not shortest paths
+                                 of the current links (net['rc']), see oracle.diff()
+
+'''
+def wrong_routes(net):
+    return sum(len(oracle.diff(net['servers'], net['rc'], srv_id, dict(dv.snapshot(st).items()),
+                               st['inf']))
+               for srv_id, st in net['nodes'].items() if srv_id not in net['down'])
+
+'''
+
+    Command: def phase(): runs until nothing changed for longer than the dead neighbor timeout
+                          (or max_time virtual seconds) and reports the phase. check also
+                          counts the wrong routes after it.
+
+    Returns:
+        dictionary with convergence time, messages/bytes until convergence and in total
+
+'''
+def phase(net, name, max_time, check=False):
+    start, msgs, nbytes = net['now'], net['msgs'], net['bytes']
+    wall = time.perf_counter()
+    net['last_change'], net['msgs_at_change'], net['bytes_at_change'] = start, msgs, nbytes
+    # quiet long enough for a crash to be detected
+    settle = (net['dead_mult'] + 1) * net['interval']
+    while net['now'] - start < max_time:
+        step(net)
+        # route changes that did not trigger an update (damped) count too
+        last = max(st.last_change for st in net['nodes'].values())
+        if last > net['last_change']:
+            net['last_change'] = last
+            net['msgs_at_change'], net['bytes_at_change'] = net['msgs'], net['bytes']
+        busy = net['queue'] or any(st.trigger.flag for st in net['nodes'].values())
+        if not busy and net['now'] - net['last_change'] >= settle:
+            break
+    res = {
+        'phase' : name,
+        'converged' : net['now'] - net['last_change'] >= settle,
+        'time' : net['last_change'] - start,
+        'msgs' : net['msgs_at_change'] - msgs,
+        'bytes' : net['bytes_at_change'] - nbytes,
+        'total_msgs' : net['msgs'] - msgs,
+        'total_bytes' : net['bytes'] - nbytes,
+        'wall' : time.perf_counter() - wall
+    }
+    if check:
+        res['wrong'] = wrong_routes(net)
+    print(f"{name:<10}| {'yes' if res['converged'] else 'NO':^5}| {res['time']:>8.2f} s "
+          f"| {res['msgs']:>9} | {res['bytes']:>12} | {res['wall']:>8.2f} s"
+          + (f" | {res['wrong']:>6}" if check else ""))
+    return res
+
+'''
+
+    Command: def simulate(): loads the topology, converges, applies the optional event and
+                             converges again
+
+'''
+def simulate(servers, rc, interval, update=None, crash=None, max_time=600, check=False,
+             **opts):
+    wall = time.perf_counter()
+    net = mk_net(servers, rc, interval, **opts)
+    print(f"{len(servers)} servers, {len(rc)} links, setup {time.perf_counter() - wall:.2f} s\n")
+    print(f"{'phase':<10}| conv | {'time':>10} | {'messages':>9} | {'bytes':>12} | {'wall':>10}"
+          + (" | wrong" if check else ""))
+    results = [phase(net, 'start', max_time, check)]
+    # link cost change, through the real update command on server1
+    if update is not None:
+        s1, s2, cost = update
+        dv.update(net['nodes'][int(s1)], s1, s2, cost)
+        # the link as the oracle sees it now
+        pair = {int(s1), int(s2)}
+        net['rc'] = [(r[0], r[1], str(cost)) if {int(r[0]), int(r[1])} == pair else r
+                     for r in net['rc']]
+        results.append(phase(net, 'update', max_time, check))
+    # server crash - it stops sending and receiving
+    if crash is not None:
+        dv.crash(net['nodes'][crash])
+        net['down'].add(crash)
+        net['rc'] = [r for r in net['rc'] if crash not in (int(r[0]), int(r[1]))]
+        results.append(phase(net, 'crash', max_time, check))
+    return net, results
+
+'''
+
+    Command: def p_args(): handles the command line - topology, interval and the dv.py options
+
+'''
+def p_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-t','--topology', required=True)
+    ap.add_argument('-i','--interval', type=int, default=1)
+    ap.add_argument('-f','--format', choices=('json','bin'), default='bin')
+    ap.add_argument('-m','--mtu', type=int, default=dv.MAX_UDP)
+    ap.add_argument('-e','--engine', choices=('dict','array'), default='dict')
+    ap.add_argument('-d','--delta', action='store_true')
+    ap.add_argument('--full-every', type=int, default=10)
+    ap.add_argument('--holddown', type=float, default=0.2)
+    ap.add_argument('--horizon', choices=('none','split','poison'), default='none')
+    ap.add_argument('--infinity', type=int, default=dv.INF)
+    ap.add_argument('--dead-mult', type=float, default=3)
+    ap.add_argument('--dead-gran', type=float, default=0.05)
+    ap.add_argument('--rx-rate', type=float, default=0)
+    ap.add_argument('--rx-burst', type=float, default=0)
+    # events after the first convergence
+    ap.add_argument('--update', nargs=3, metavar=('S1','S2','COST'))
+    ap.add_argument('--crash', type=int)
+    ap.add_argument('--max-time', type=float, default=600)
+    # wrong routes (oracle.py) after each phase
+    ap.add_argument('--check', action='store_true')
+    return ap.parse_args()
+
+def main():
+    args = p_args()
+    try:
+        servers, rc, _ = dv.read_top(args.topology)
+    except dv.TopologyError as e:
+        print(f"Error: {e}")
+        return
+    simulate(servers, rc, args.interval, update=args.update, crash=args.crash,
+             max_time=args.max_time, check=args.check, wire=args.format, mtu=args.mtu, delta=args.delta,
+             full_every=args.full_every, holddown=args.holddown, horizon=args.horizon,
+             infinity=args.infinity, engine=args.engine, dead_mult=args.dead_mult,
+             dead_gran=args.dead_gran, rx_rate=args.rx_rate, rx_burst=args.rx_burst)
+
+if __name__ == "__main__":
+    main()